@@ -0,0 +1,113 @@
+import random
+import time
+from statistics import median
+
+from memorizer import models
+from memorizer.application import create_app as memorizer_app
+from memorizer.cache import cache
+from memorizer.database import db
+from memorizer.stats import summarize, summary_mappings
+
+
+def create_app():
+    return memorizer_app('../benchmarks/config.py')
+
+
+def reset_database():
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    cache.clear()
+
+
+def seed_course(questions, code='BENCH', exam_size=100):
+    """Creates a course with `questions` boolean questions spread over exams of `exam_size` questions"""
+    course = models.Course(code, 'Benchmark course')
+    db.session.add(course)
+    db.session.commit()
+    exams = [{'name': 'E%05d' % n, 'course_id': course.id} for n in range(0, questions, exam_size)]
+    db.session.execute(models.Exam.__table__.insert(), exams)
+    exam_ids = [exam_id for exam_id, in db.session.query(models.Exam.id).filter_by(course_id=course.id)]
+    db.session.execute(models.Question.__table__.insert(), [
+        {'type': models.Question.BOOLEAN, 'text': 'Question %d' % n, 'exam_id': exam_ids[n // exam_size],
+         'correct': bool(n % 2)}
+        for n in range(questions)
+    ])
+    db.session.commit()
+    return course
+
+
+def timed(function, samples):
+    """Median wall time in microseconds of calling function with each sample"""
+    timings = []
+    for sample in samples:
+        start = time.perf_counter()
+        function(sample)
+        timings.append((time.perf_counter() - start) * 10 ** 6)
+    return median(timings)
+
+
+def positions(count, samples=200):
+    return [random.randint(1, count) for _ in range(samples)]
+
+
+def exam_json(questions, code='BENCH', exam='E1'):
+    """Synthetic exam in the import format, every other question has four alternatives"""
+    return {
+        'code': code,
+        'name': 'Benchmark course',
+        'exam': exam,
+        'questions': [
+            {'question': 'Question %d' % n, 'answers': ['A', 'B', 'C', 'D'], 'correct': n % 4}
+            if n % 2 else {'question': 'Question %d' % n, 'answer': bool(n % 3)}
+            for n in range(questions)
+        ]
+    }
+
+
+def seed_data(courses, exams, questions, users, answers):
+    """
+        Creates courses with exams of boolean and multiple choice questions, and users
+        who have answered random questions. Returns the course codes and user ids
+    """
+    codes = ['BENCH%d' % n for n in range(courses)]
+    db.session.execute(models.Course.__table__.insert(), [
+        {'code': code, 'name': 'Benchmark course'} for code in codes
+    ])
+    db.session.execute(models.Exam.__table__.insert(), [
+        {'name': 'E%03d' % n, 'course_id': course_id}
+        for course_id, in db.session.query(models.Course.id) for n in range(exams)
+    ])
+    exam_ids = [exam_id for exam_id, in db.session.query(models.Exam.id)]
+    db.session.execute(models.Question.__table__.insert(), [
+        # Every other question is multiple choice
+        {'type': models.Question.MULTIPLE if n % 2 else models.Question.BOOLEAN, 'text': 'Question %d' % n,
+         'exam_id': exam_id, 'correct': None if n % 2 else bool(n % 3)}
+        for exam_id in exam_ids for n in range(questions)
+    ])
+    multiple = db.session.query(models.Question.id).filter_by(type=models.Question.MULTIPLE)
+    db.session.execute(models.Alternative.__table__.insert(), [
+        {'text': 'Alternative %d' % n, 'correct': n == 0, 'question_id': question_id}
+        for question_id, in multiple for n in range(4)
+    ])
+    db.session.execute(models.User.__table__.insert(), [
+        {'name': 'User %d' % n, 'registered': False, 'admin': False} for n in range(users)
+    ])
+    user_ids = [user_id for user_id, in db.session.query(models.User.id)]
+    question_ids = [question_id for question_id, in db.session.query(models.Question.id)]
+    stats = [
+        {'user_id': user_id, 'question_id': question_id, 'correct': random.random() < 0.7, 'reset': False}
+        for user_id in user_ids
+        for question_id in random.sample(question_ids, min(answers, len(question_ids)))
+    ]
+    if stats:
+        db.session.execute(models.Stats.__table__.insert(), stats)
+    db.session.bulk_insert_mappings(models.StatsSummary, summary_mappings(summarize()))
+    db.session.commit()
+    return codes, user_ids
+
+
+def percentile(values, share):
+    """Nearest-rank percentile"""
+    values = sorted(values)
+    return values[max(0, int(round(share * len(values) + 0.5)) - 1)]
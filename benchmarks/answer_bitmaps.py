@@ -0,0 +1,57 @@
+"""
+    Cache memory for the answered questions of 100k users.
+
+    Compares the pickled answer bitsets kept in the cache with a set of
+    answered question ids, and times counting answers in each.
+    Run with python -m benchmarks.answer_bitmaps
+"""
+import pickle
+import random
+
+from memorizer.bitmaps import AnswerBits, popcount
+
+from benchmarks import timed
+
+USERS = 100000
+# Users are sampled and the sizes scaled up to all users
+SAMPLE = 1000
+COURSE_SIZES = [1000, 10000]
+ANSWERED = [0.1, 0.5, 0.9]
+
+
+def random_answers(size, share):
+    answered = random.sample(range(size), int(size * share))
+    correct = random.sample(answered, len(answered) // 2)
+    return answered, correct
+
+
+def to_bits(indexes):
+    bits = 0
+    for index in indexes:
+        bits |= 1 << index
+    return bits
+
+
+def main():
+    print('{:>9} {:>9} {:>13} {:>13} {:>15} {:>15}'.format(
+        'questions', 'answered', 'bitset (MB)', 'id set (MB)', 'popcount (us)', 'len (us)'
+    ))
+    for size in COURSE_SIZES:
+        for share in ANSWERED:
+            bitsets = []
+            id_sets = []
+            for _ in range(SAMPLE):
+                answered, correct = random_answers(size, share)
+                bitsets.append(pickle.dumps((0, ) + AnswerBits(to_bits(answered), to_bits(correct))))
+                id_sets.append(pickle.dumps((set(answered), set(correct))))
+            bitset_mb = sum(map(len, bitsets)) / SAMPLE * USERS / 10 ** 6
+            id_set_mb = sum(map(len, id_sets)) / SAMPLE * USERS / 10 ** 6
+            count_bits = timed(lambda data: popcount(pickle.loads(data)[1]), bitsets[:200])
+            count_ids = timed(lambda data: len(pickle.loads(data)[0]), id_sets[:200])
+            print('{:>9} {:>8.0f}% {:>13.1f} {:>13.1f} {:>15.1f} {:>15.1f}'.format(
+                size, share * 100, bitset_mb, id_set_mb, count_bits, count_ids
+            ))
+
+
+if __name__ == '__main__':
+    main()
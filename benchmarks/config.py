@@ -0,0 +1,3 @@
+SQLALCHEMY_DATABASE_URI = "sqlite://"
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+SECRET_KEY = 'benchmark'
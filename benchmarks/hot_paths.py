@@ -0,0 +1,176 @@
+"""
+    Latency and SQL statements of the quiz and API hot paths.
+
+    Seeds synthetic courses, exams, questions, users and answers, requests
+    every hot endpoint as random users and measures the importer, then
+    writes p50/p99 latency and statement counts as JSON. Comparing with
+    the results of an earlier commit shows regressions:
+
+        python -m benchmarks.hot_paths --output before.json
+        python -m benchmarks.hot_paths --output after.json --compare before.json
+"""
+import argparse
+import json
+import random
+import re
+import subprocess
+import time
+from statistics import mean
+
+from flask import url_for
+from sqlalchemy import event
+
+from memorizer import importer, models
+from memorizer.database import db
+
+from benchmarks import create_app, exam_json, percentile, reset_database, seed_data
+
+TIMING = re.compile(r'desc="(\d+) queries"')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', type=int, default=3)
+    parser.add_argument('--exams', type=int, default=10, help='exams per course')
+    parser.add_argument('--questions', type=int, default=100, help='questions per exam')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--answers', type=int, default=200, help='answers per user')
+    parser.add_argument('--requests', type=int, default=300, help='requests per endpoint')
+    parser.add_argument('--import-questions', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='hot_paths.json')
+    parser.add_argument('--compare', help='results of an earlier run')
+    return parser.parse_args()
+
+
+def summarize_timings(timings, queries):
+    return {
+        'requests': len(timings),
+        'p50_ms': percentile(timings, 0.5),
+        'p99_ms': percentile(timings, 0.99),
+        'mean_queries': mean(queries),
+        'max_queries': max(queries),
+    }
+
+
+class Session:
+    """A test client logged in as a user"""
+    def __init__(self, app, user_id):
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session['user'] = user_id
+
+    def request(self, method, url, data=None):
+        start = time.perf_counter()
+        response = self.client.open(url, method=method, data=data)
+        elapsed = (time.perf_counter() - start) * 1000
+        assert response.status_code < 400, (url, response.status_code)
+        return elapsed, int(TIMING.search(response.headers['Server-Timing']).group(1))
+
+
+def endpoints(args, codes):
+    """Endpoint name -> function returning the method, url and form data of a random request"""
+    size = args.exams * args.questions
+    question_ids = [question_id for question_id, in db.session.query(models.Question.id)]
+
+    def course():
+        return random.choice(codes)
+
+    def answer():
+        question = random.choice(question_ids)
+        # Answered questions are checked but not saved again, like on a real site
+        return 'POST', url_for('api.answer'), {'question': question, 'correct': 'true', 'alternative': 0}
+
+    return {
+        'quiz.question_course': lambda: ('GET', url_for(
+            'quiz.question_course', course_code=course(), id=random.randint(1, size)
+        ), None),
+        'api.course_questions': lambda: ('GET', url_for('api.course_questions', course=course()), None),
+        'api.answer': answer,
+        'api.random_question_course': lambda: (
+            'GET', url_for('api.random_question_course', course_code=course()), None
+        ),
+        'api.stats_course': lambda: ('GET', url_for('api.stats_course', course_code=course()), None),
+    }
+
+
+def measure_endpoints(app, args, codes, user_ids):
+    sessions = [Session(app, user_id) for user_id in user_ids]
+    with app.test_request_context():
+        requests = {name: [make() for _ in range(args.requests)] for name, make in endpoints(args, codes).items()}
+    results = {}
+    for name, planned in requests.items():
+        timings = []
+        queries = []
+        for method, url, data in planned:
+            elapsed, count = random.choice(sessions).request(method, url, data)
+            timings.append(elapsed)
+            queries.append(count)
+        results[name] = summarize_timings(timings, queries)
+    return results
+
+
+def measure_importer(app, args, runs=5):
+    statements = []
+    timings = []
+
+    def count(*args):
+        statements.append(1)
+    with app.app_context():
+        for run in range(runs):
+            data = exam_json(args.import_questions, code='IMPORT', exam='E%d' % run)
+            event.listen(db.engine, 'before_cursor_execute', count)
+            start = time.perf_counter()
+            rows = importer.import_exam(data)
+            timings.append((time.perf_counter() - start) * 1000)
+            event.remove(db.engine, 'before_cursor_execute', count)
+    result = summarize_timings(timings, [len(statements) / runs])
+    result['rows_per_second'] = rows / (percentile(timings, 0.5) / 1000)
+    return result
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL)
+        return commit.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, previous=None):
+    print('{:<28} {:>10} {:>10} {:>10} {:>14}'.format('endpoint', 'p50 (ms)', 'p99 (ms)', 'queries', 'p50 change'))
+    for name, result in results.items():
+        change = ''
+        if previous and name in previous:
+            change = '{:+.0f}%'.format((result['p50_ms'] / previous[name]['p50_ms'] - 1) * 100)
+        print('{:<28} {:>10.2f} {:>10.2f} {:>10.1f} {:>14}'.format(
+            name, result['p50_ms'], result['p99_ms'], result['mean_queries'], change
+        ))
+
+
+def main():
+    args = parse_args()
+    random.seed(args.seed)
+    app = create_app()
+    with app.app_context():
+        reset_database()
+        codes, user_ids = seed_data(args.courses, args.exams, args.questions, args.users, args.answers)
+    # Requests get an app context of their own, like in production
+    results = measure_endpoints(app, args, codes, user_ids)
+    results['importer'] = measure_importer(app, args)
+    config = {key: value for key, value in vars(args).items() if key not in ('output', 'compare')}
+    previous = None
+    if args.compare:
+        with open(args.compare) as file:
+            earlier = json.load(file)
+        if earlier['config'] != config:
+            print('warning: {} was run with different data: {}'.format(args.compare, earlier['config']))
+        previous = earlier['results']
+    print_results(results, previous)
+    with open(args.output, 'w') as file:
+        json.dump({'commit': git_commit(), 'config': config, 'results': results}, file, indent=2)
+    print('results written to', args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+    Import throughput of the bulk importer compared with the old
+    commit-per-question importer. Run with python -m benchmarks.importer
+"""
+import time
+
+from memorizer import importer, models
+from memorizer.database import db
+
+from benchmarks import create_app, exam_json, reset_database
+
+QUESTIONS = 2000
+
+
+def legacy_import_question(question, exam):
+    if 'answers' in question:
+        question_type = models.Question.MULTIPLE
+        answer = None
+    else:
+        question_type = models.Question.BOOLEAN
+        answer = question['answer']
+    question_object = models.Question(question_type, question['question'], exam.id, question.get('image', ''), answer)
+    db.session.add(question_object)
+    db.session.commit()
+    if question_type != models.Question.MULTIPLE:
+        return
+    for number, answer in enumerate(question['answers']):
+        alternative = models.Alternative(answer, question['correct'] == number, question_object.id)
+        db.session.add(alternative)
+    db.session.commit()
+
+
+def legacy_import_exam(exam_json):
+    importer.validate_exam(exam_json)
+    exam = importer.get_exam(exam_json)
+    for question_json in exam_json['questions']:
+        legacy_import_question(question_json, exam)
+
+
+def measure(function, data):
+    reset_database()
+    start = time.perf_counter()
+    function(data)
+    seconds = time.perf_counter() - start
+    rows = models.Question.query.count() + models.Alternative.query.count()
+    return rows, seconds
+
+
+def main():
+    app = create_app()
+    data = exam_json(QUESTIONS)
+    with app.app_context():
+        print('{:>8} {:>8} {:>10} {:>10}'.format('importer', 'rows', 'seconds', 'rows/sec'))
+        results = {}
+        for name, function in [('legacy', legacy_import_exam), ('bulk', importer.import_exam)]:
+            rows, seconds = measure(function, data)
+            results[name] = seconds
+            print('{:>8} {:>8} {:>10.2f} {:>10.0f}'.format(name, rows, seconds, rows / seconds))
+        print('speedup: {:.1f}x'.format(results['legacy'] / results['bulk']))
+
+
+if __name__ == '__main__':
+    main()
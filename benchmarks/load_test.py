@@ -0,0 +1,205 @@
+"""
+    Load test with concurrent simulated students.
+
+    Serves the app with a threaded WSGI server and lets each student open a
+    course, fetch the question list, answer questions, ask for random
+    questions and stats, and now and then reset their stats. Reports
+    throughput, latency percentiles per step and the share of errors and
+    database lock errors.
+
+    The database is emptied and seeded first, so point --database at a
+    scratch database, for example a local PostgreSQL:
+
+        python -m benchmarks.load_test --students 100 --duration 30
+        python -m benchmarks.load_test --database postgresql://localhost/memorizer_load
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from http.cookiejar import CookieJar
+from socketserver import ThreadingMixIn
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, build_opener
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from flask import got_request_exception
+
+from memorizer.application import mail_handler
+
+from benchmarks import create_app, percentile, reset_database, seed_data
+
+# Errors raised when the database could not take a lock in time
+LOCK_ERRORS = ('database is locked', 'deadlock detected', 'could not serialize', 'lock timeout')
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', help='database URI, a temporary SQLite file by default')
+    parser.add_argument('--students', type=int, default=50, help='concurrent simulated students')
+    parser.add_argument('--duration', type=float, default=20, help='seconds')
+    parser.add_argument('--courses', type=int, default=3)
+    parser.add_argument('--exams', type=int, default=5, help='exams per course')
+    parser.add_argument('--questions', type=int, default=100, help='questions per exam')
+    parser.add_argument('--answers', type=int, default=5, help='questions answered per visit')
+    parser.add_argument('--reset-chance', type=float, default=0.05, help='chance of resetting stats after a visit')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the results as JSON')
+    return parser.parse_args()
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = defaultdict(list)
+        self.errors = Counter()
+        self.lock_errors = 0
+
+    def add(self, step, milliseconds, error=None):
+        with self.lock:
+            self.timings[step].append(milliseconds)
+            if error:
+                self.errors[step, error] += 1
+
+    def server_error(self, sender, exception, **extra):
+        if any(message in str(exception) for message in LOCK_ERRORS):
+            with self.lock:
+                self.lock_errors += 1
+
+    def report(self, seconds):
+        requests = sum(len(timings) for timings in self.timings.values())
+        errors = sum(self.errors.values())
+        return {
+            'requests': requests,
+            'seconds': seconds,
+            'requests_per_second': requests / seconds,
+            'error_rate': errors / requests if requests else 0,
+            'lock_error_rate': self.lock_errors / requests if requests else 0,
+            'errors': {'{} {}'.format(*key): count for key, count in self.errors.items()},
+            'steps': {
+                step: {
+                    'requests': len(timings),
+                    'p50_ms': percentile(timings, 0.5),
+                    'p95_ms': percentile(timings, 0.95),
+                    'p99_ms': percentile(timings, 0.99),
+                }
+                for step, timings in self.timings.items()
+            },
+        }
+
+
+class Student:
+    """A visitor with a session cookie of their own, starting out anonymous"""
+    def __init__(self, base_url, codes, results, args):
+        self.base_url = base_url
+        self.codes = codes
+        self.results = results
+        self.args = args
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()))
+
+    def request(self, step, path, data=None):
+        start = time.perf_counter()
+        error = None
+        try:
+            body = urlencode(data).encode() if data else None
+            with self.opener.open(self.base_url + path, body) as response:
+                body = response.read()
+        except HTTPError as e:
+            error = e.code
+            body = None
+        except (URLError, ConnectionError) as e:
+            error = type(e).__name__
+            body = None
+        self.results.add(step, (time.perf_counter() - start) * 1000, error)
+        return body
+
+    def visit(self):
+        code = random.choice(self.codes)
+        self.request('open course', '/{}/'.format(code))
+        body = self.request('question list', '/api/questions/{}/all/'.format(code))
+        questions = json.loads(body.decode()) if body else []
+        for question in random.sample(questions, min(self.args.answers, len(questions))):
+            if question['multiple']:
+                data = {'question': question['id'], 'alternative': random.choice(question['alternatives'])['id']}
+            else:
+                data = {'question': question['id'], 'correct': random.choice(['true', 'false'])}
+            self.request('answer', '/api/answer', data)
+        self.request('random', '/api/random/{}/'.format(code))
+        self.request('stats', '/api/stats/{}/'.format(code))
+        if random.random() < self.args.reset_chance:
+            self.request('reset', '/reset/{}/'.format(code))
+
+    def run(self, deadline):
+        while time.perf_counter() < deadline:
+            self.visit()
+
+
+def main():
+    args = parse_args()
+    random.seed(args.seed)
+    app = create_app()
+    app.logger.removeHandler(mail_handler)
+    directory = None
+    if args.database:
+        app.config['SQLALCHEMY_DATABASE_URI'] = args.database
+    else:
+        directory = tempfile.TemporaryDirectory()
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(directory.name, 'load.db')
+    with app.app_context():
+        reset_database()
+        codes, user_ids = seed_data(args.courses, args.exams, args.questions, users=0, answers=0)
+
+    results = Results()
+    got_request_exception.connect(results.server_error, app)
+    server = make_server('127.0.0.1', 0, app, server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = 'http://127.0.0.1:{}'.format(server.server_port)
+
+    print('{} students for {}s against {}'.format(args.students, args.duration, app.config['SQLALCHEMY_DATABASE_URI']))
+    start = time.perf_counter()
+    deadline = start + args.duration
+    students = [
+        threading.Thread(target=Student(base_url, codes, results, args).run, args=(deadline,))
+        for _ in range(args.students)
+    ]
+    for student in students:
+        student.start()
+    for student in students:
+        student.join()
+    report = results.report(time.perf_counter() - start)
+    server.shutdown()
+    if directory:
+        directory.cleanup()
+
+    print('{:.0f} requests/s, {:.2%} errors, {:.2%} lock errors'.format(
+        report['requests_per_second'], report['error_rate'], report['lock_error_rate']
+    ))
+    print('{:<14} {:>9} {:>10} {:>10} {:>10}'.format('step', 'requests', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)'))
+    for step, step_report in report['steps'].items():
+        print('{:<14} {:>9} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+            step, step_report['requests'], step_report['p50_ms'], step_report['p95_ms'], step_report['p99_ms']
+        ))
+    for error, count in report['errors'].items():
+        print('error:', error, count)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'config': vars(args), 'results': report}, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""
+    Question lookup latency for growing courses.
+
+    Compares resolving question number n through the ordinal index
+    with the old OFFSET query. Run with python -m benchmarks.question_lookup
+"""
+from memorizer import models
+
+from benchmarks import create_app, positions, reset_database, seed_course, timed
+
+SIZES = [100, 1000, 10000, 100000]
+
+
+def offset_lookup(course, number):
+    return models.Question.query\
+        .filter_by(course=course)\
+        .join(models.Question.exam)\
+        .filter(models.Exam.hidden.is_(False))\
+        .offset(number - 1).limit(1).first()
+
+
+def main():
+    app = create_app()
+    with app.app_context():
+        print('{:>8} {:>14} {:>14}'.format('size', 'ordinal (us)', 'offset (us)'))
+        for size in SIZES:
+            reset_database()
+            course = seed_course(size)
+            samples = positions(size)
+            # Warm up the ordinal index
+            course.question(1).first()
+            ordinal = timed(lambda number: course.question(number).first(), samples)
+            offset = timed(lambda number: offset_lookup(course, number), samples)
+            print('{:>8} {:>14.0f} {:>14.0f}'.format(size, ordinal, offset))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+    Picking a random unanswered question in a large, mostly answered course.
+
+    Compares random_id, which picks an unset bit of the answered questions bitset, with the
+    old implementation reading every answered question.
+    Run with python -m benchmarks.random_question
+"""
+import random
+
+from flask import g
+
+from memorizer import models, utils
+from memorizer.database import db
+
+from benchmarks import create_app, reset_database, seed_course, timed
+
+QUESTIONS = 10000
+ANSWERED = [0.5, 0.9, 0.99]
+SAMPLES = 200
+
+
+def legacy_random_id(id=None, course=None, exam=None):
+    questions = utils.all_questions(course, exam)
+    query = models.Stats.course(g.user, course)
+    answered = {question_id for question_id, in query.with_entities(models.Stats.question_id)}
+    indexes = [i + 1 for i, question in enumerate(questions) if (i + 1) != id and question not in answered]
+    if indexes:
+        return random.choice(indexes)
+    return random.randint(1, len(questions) + 1)
+
+
+def answer(user, course, share):
+    question_ids = list(utils.all_questions(course.code, None))
+    answered = random.sample(question_ids, int(len(question_ids) * share))
+    db.session.execute(models.Stats.__table__.insert(), [
+        {'user_id': user.id, 'question_id': question_id, 'correct': True, 'reset': False}
+        for question_id in answered
+    ])
+    db.session.commit()
+
+
+def main():
+    app = create_app()
+    with app.test_request_context():
+        print('{:>9} {:>13} {:>13}'.format('answered', 'bitset (us)', 'legacy (us)'))
+        for share in ANSWERED:
+            reset_database()
+            course = seed_course(QUESTIONS)
+            g.user = models.User()
+            db.session.add(g.user)
+            db.session.commit()
+            answer(g.user, course, share)
+            samples = range(SAMPLES)
+            bitset = timed(lambda _: utils.random_id(id=1, course=course.code), samples)
+            legacy = timed(lambda _: legacy_random_id(id=1, course=course.code), samples)
+            print('{:>8.0f}% {:>13.0f} {:>13.0f}'.format(share * 100, bitset, legacy))
+
+
+if __name__ == '__main__':
+    main()
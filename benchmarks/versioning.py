@@ -0,0 +1,66 @@
+"""
+    Import and edit throughput with each versioning policy: versions saved
+    along with the rows, alternatives without history and no history at all.
+    Run with python -m benchmarks.versioning
+"""
+import time
+
+from sqlalchemy import event
+
+from memorizer import importer, models
+from memorizer.database import db, versioning_policy
+
+from benchmarks import create_app, exam_json, reset_database
+
+QUESTIONS = 2000
+EDITS = 500
+POLICIES = [
+    ('sync', []),
+    ('sync', ['Alternative']),
+    ('off', []),
+]
+
+
+def measure_import(data):
+    statements = []
+
+    def count(*args):
+        statements.append(1)
+    reset_database()
+    event.listen(db.engine, 'before_cursor_execute', count)
+    start = time.perf_counter()
+    rows = importer.import_exam(data)
+    seconds = time.perf_counter() - start
+    event.remove(db.engine, 'before_cursor_execute', count)
+    return rows / seconds, len(statements) / len(data['questions'])
+
+
+def measure_edits():
+    """Edits through the ORM, committing each like the admin API does"""
+    questions = models.Question.query.limit(EDITS).all()
+    start = time.perf_counter()
+    for n, question in enumerate(questions):
+        question.text = 'Edited question %d' % n
+        db.session.commit()
+    return len(questions) / (time.perf_counter() - start)
+
+
+def main():
+    app = create_app()
+    data = exam_json(QUESTIONS)
+    with app.app_context():
+        print('{:<10} {:<14} {:>12} {:>20} {:>10}'.format(
+            'versioning', 'unversioned', 'import rows/s', 'statements/question', 'edits/s'
+        ))
+        for mode, unversioned in POLICIES:
+            app.config.update(VERSIONING=mode, UNVERSIONED_MODELS=unversioned)
+            versioning_policy.init_app(app)
+            rows_per_second, statements = measure_import(data)
+            edits_per_second = measure_edits()
+            print('{:<10} {:<14} {:>12.0f} {:>20.2f} {:>10.0f}'.format(
+                mode, ','.join(unversioned) or '-', rows_per_second, statements, edits_per_second
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+import fcntl
+import glob
+import json
+import os
+import threading
+from collections import namedtuple
+
+from sqlalchemy.exc import DataError, IntegrityError
+
+from memorizer import models
+from memorizer.bitmaps import record_answer
+from memorizer.database import db
+
+# Saving stats only needs the id of the user
+UserRef = namedtuple('UserRef', 'id')
+
+
+class AnswerLog:
+    """
+        Saves answers. In write-behind mode answers are appended to a journal
+        and a background thread saves them to the database in batches, while
+        pending() lets the user's own stats include answers not saved yet.
+        Every process has its own journal, locked while it runs, and replays
+        the journals left by stopped processes on startup, so no answers are
+        lost when a process crashes. The journal is synced to disk once per
+        flush interval, so a power failure can lose the answers of the last one
+    """
+    def __init__(self):
+        self.enabled = False
+        self.app = None
+        self.journal = None
+        self.unsynced = False
+        self.pending_answers = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.thread = None
+        self.stopping = False
+
+    def init_app(self, app):
+        self.app = app
+        if app.config.get('ANSWER_WRITE_BEHIND') and not self.enabled:
+            self.open(
+                app.config.get('ANSWER_JOURNAL', 'answers.journal'),
+                app.config.get('ANSWER_FLUSH_INTERVAL', 200),
+                app.config.get('ANSWER_FLUSH_ROWS', 100)
+            )
+            with app.app_context():
+                self.replay()
+            self.start()
+
+    def open(self, journal_path, interval=200, batch_size=100):
+        """
+            Enables write-behind with a journal named after journal_path and the process id,
+            flushing every interval milliseconds or batch_size answers
+        """
+        self.journal_base = journal_path
+        self.journal_path = '{}.{}'.format(journal_path, os.getpid())
+        self.interval = interval / 1000
+        self.batch_size = batch_size
+        self.journal = open(self.journal_path, 'a', encoding='utf-8')
+        fcntl.flock(self.journal.fileno(), fcntl.LOCK_EX)
+        self.enabled = True
+
+    def close(self):
+        """Stops the background thread and saves what is left"""
+        if self.thread:
+            with self.lock:
+                self.stopping = True
+                self.wakeup.notify()
+            self.thread.join()
+            self.thread = None
+            self.stopping = False
+        if self.enabled:
+            self.flush()
+            if not self.pending_answers:
+                os.remove(self.journal_path)
+            self.journal.close()
+            self.enabled = False
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='answer-log', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            with self.lock:
+                if not self.stopping and len(self.pending_answers) < self.batch_size:
+                    self.wakeup.wait(self.interval)
+                if self.stopping:
+                    return
+            with self.app.app_context():
+                try:
+                    self.sync()
+                    self.flush()
+                except Exception:
+                    # Answers stay in the journal and are retried on the next flush
+                    self.app.logger.exception('Saving answers failed')
+
+    def save(self, user, question_id, key, correct):
+        """Saves an answer unless the question is already answered, returns if it was saved"""
+        if not self.enabled:
+            user_id = user.id
+            saved = models.Stats.add_once(user, question_id, correct)
+            if saved:
+                models.StatsSummary.record(user, key.course_id, key.exam_id, correct)
+            models.db.session.commit()
+            if saved:
+                record_answer(user_id, key.course_code, key.exam_name, question_id, correct)
+            return saved
+        # Anonymous users are saved right away, answers need their id
+        models.db.session.commit()
+        if self.answered(user, question_id):
+            return False
+        answer = {
+            'user_id': user.id,
+            'question_id': question_id,
+            'correct': correct,
+            'course_id': key.course_id,
+            'exam_id': key.exam_id,
+            'course_code': key.course_code,
+            'exam_name': key.exam_name,
+        }
+        with self.lock:
+            # Synced to disk by the background thread, not for every answer
+            self.journal.write(json.dumps(answer) + '\n')
+            self.journal.flush()
+            self.unsynced = True
+            self.pending_answers.append(answer)
+            if len(self.pending_answers) >= self.batch_size:
+                self.wakeup.notify()
+        return True
+
+    def answered(self, user, question_id):
+        if any(answer['question_id'] == question_id for answer in self.pending(user)):
+            return True
+        answered = models.Stats.query.filter_by(user_id=user.id, question_id=question_id, reset=False)
+        return db.session.query(answered.exists()).scalar()
+
+    def pending(self, user, course_code=None, exam_name=None):
+        """The user's answers that are not saved yet, optionally only for a course or exam"""
+        if not self.enabled or user.id is None:
+            return []
+        with self.lock:
+            return [
+                answer for answer in self.pending_answers
+                if answer['user_id'] == user.id and
+                course_code in (None, answer['course_code']) and
+                exam_name in (None, answer['exam_name'])
+            ]
+
+    def sync(self):
+        """Makes sure the answers written to the journal are on disk"""
+        with self.flush_lock:
+            with self.lock:
+                unsynced, self.unsynced = self.unsynced, False
+            if unsynced:
+                os.fsync(self.journal.fileno())
+
+    def flush(self):
+        """Saves the pending answers, then drops them from the journal"""
+        with self.flush_lock:
+            with self.lock:
+                batch = list(self.pending_answers)
+            if not batch:
+                return 0
+            saved = self.write(batch)
+            with self.lock:
+                self.pending_answers = self.pending_answers[len(batch):]
+                self.rewrite_journal()
+            return saved
+
+    def write(self, answers):
+        """Saves answers in one transaction, or one at a time if some of them can't be saved"""
+        try:
+            saved = self.insert(answers)
+        except (IntegrityError, DataError):
+            db.session.rollback()
+            saved = []
+            for answer in answers:
+                try:
+                    saved.extend(self.insert([answer]))
+                except (IntegrityError, DataError):
+                    db.session.rollback()
+                    # Like an answer to a question deleted since, it would fail every time it is retried
+                    self.app.logger.exception('Dropping answer that cannot be saved: %s', json.dumps(answer))
+        for answer in saved:
+            record_answer(
+                answer['user_id'], answer['course_code'], answer['exam_name'], answer['question_id'], answer['correct']
+            )
+        return len(saved)
+
+    def insert(self, answers):
+        """Adds answers to the stats and commits them, returns the ones that were not answered already"""
+        saved = []
+        for answer in answers:
+            user = UserRef(answer['user_id'])
+            if models.Stats.add_once(user, answer['question_id'], answer['correct']):
+                models.StatsSummary.record(user, answer['course_id'], answer['exam_id'], answer['correct'])
+                saved.append(answer)
+        db.session.commit()
+        return saved
+
+    def rewrite_journal(self):
+        """Replaces the journal with the answers still pending, must hold both locks"""
+        path = self.journal_path + '.tmp'
+        journal = open(path, 'w', encoding='utf-8')
+        # Locked before it takes the place of the journal
+        fcntl.flock(journal.fileno(), fcntl.LOCK_EX)
+        for answer in self.pending_answers:
+            journal.write(json.dumps(answer) + '\n')
+        journal.flush()
+        os.fsync(journal.fileno())
+        os.replace(path, self.journal_path)
+        self.journal.close()
+        self.journal = journal
+        self.unsynced = False
+
+    def read_journal(self, journal):
+        answers = []
+        for line in journal:
+            try:
+                answers.append(json.loads(line))
+            except ValueError:
+                # Only the last line can be cut off, by a crash while it was written
+                self.app.logger.warning('Skipping incomplete answer in journal')
+        return answers
+
+    def stopped_journals(self):
+        """Opens and locks the journals of processes that are not running anymore, as (path, file)"""
+        for path in glob.glob(glob.escape(self.journal_base) + '.*'):
+            if path == self.journal_path or not path.rsplit('.', 1)[1].isdigit():
+                continue
+            journal = open(path, encoding='utf-8')
+            try:
+                fcntl.flock(journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                # Another process may have replayed and removed it before it was locked
+                if os.path.samestat(os.fstat(journal.fileno()), os.stat(path)):
+                    yield path, journal
+                    continue
+            except (BlockingIOError, FileNotFoundError):
+                pass
+            journal.close()
+
+    def replay(self):
+        """Saves the answers left in this process's journal and in the journals of stopped processes"""
+        with open(self.journal_path, encoding='utf-8') as journal:
+            answers = self.read_journal(journal)
+        stopped = []
+        for path, journal in self.stopped_journals():
+            answers.extend(self.read_journal(journal))
+            stopped.append((path, journal))
+        with self.flush_lock, self.lock:
+            self.pending_answers = answers + self.pending_answers
+            if stopped:
+                # Kept in this journal before the others are removed
+                self.rewrite_journal()
+        for path, journal in stopped:
+            os.remove(path)
+            journal.close()
+        return self.flush()
+
+
+answer_log = AnswerLog()
@@ -7,9 +7,14 @@ from flask_migrate import Migrate, MigrateCommand
 from flask_script import Manager
 from werkzeug.contrib.fixers import ProxyFix
 
+from memorizer.answerlog import answer_log
 from memorizer.cache import cache
+from memorizer.history import HistoryCommand
 from memorizer.importer import ImportCommand
 from memorizer.make_admin import AdminCommand
+from memorizer.metrics import sql_metrics
+from memorizer.snapshots import SnapshotCommand
+from memorizer.stats import StatsCommand
 from memorizer.user import get_user
 from memorizer.utils import datetimeformat, grade, percentage
 from memorizer.views.admin import admin
@@ -18,12 +23,15 @@ from memorizer.views.quiz import quiz
 
 
 def create_app(config_filename='config.py'):
-    from .database import db
+    from .database import db, versioning_policy
     app = Flask(__name__)
     app.config.from_pyfile(config_filename)
     app.wsgi_app = ProxyFix(app.wsgi_app)
     db.init_app(app)
+    versioning_policy.init_app(app)
     cache.init_app(app)
+    answer_log.init_app(app)
+    sql_metrics.init_app(app)
     migrate.init_app(app, db)
     manager(app)
     assets.init_app(app)
@@ -54,6 +62,9 @@ manager = Manager(create_app)
 manager.add_command('db', MigrateCommand)
 manager.add_command('import', ImportCommand)
 manager.add_command('admin', AdminCommand)
+manager.add_command('stats', StatsCommand)
+manager.add_command('history', HistoryCommand)
+manager.add_command('snapshots', SnapshotCommand)
 
 assets = Environment()
 js = Bundle(
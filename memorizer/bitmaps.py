@@ -0,0 +1,119 @@
+"""
+    Answered and correct questions of a user as bitsets over the ordinal
+    index of a course or exam: bit n - 1 is set when question number n has
+    been answered. They are cached and rebuilt from stats when missing
+"""
+import random
+from bisect import bisect_left
+from collections import namedtuple
+
+from memorizer import models
+from memorizer.cache import cache, content_version
+from memorizer.config import CACHE_TIME
+
+AnswerBits = namedtuple('AnswerBits', 'answered correct')
+
+
+def popcount(bits):
+    return bin(bits).count('1')
+
+
+def position(questions, question_id):
+    """Index of a question in an ordinal index, or None if it is not there"""
+    index = bisect_left(questions, question_id)
+    if index < len(questions) and questions[index] == question_id:
+        return index
+    return None
+
+
+def _key(user_id, course_code, exam_name):
+    return 'bits/{}/{}/{}'.format(user_id, course_code, exam_name or '')
+
+
+def answer_bits(user, course_code, exam_name=None):
+    """The user's answered and correct questions in a course or exam"""
+    if user.id is None:
+        return AnswerBits(0, 0)
+    key = _key(user.id, course_code, exam_name)
+    version = content_version(course_code, exam_name)
+    cached = cache.get(key)
+    # Positions move when questions are added or removed
+    if cached is not None and cached[0] == version:
+        return AnswerBits(*cached[1:])
+    bits = build_bits(user, course_code, exam_name)
+    cache.set(key, (version,) + bits, timeout=CACHE_TIME)
+    return bits
+
+
+def build_bits(user, course_code, exam_name):
+    from memorizer.utils import all_questions
+    questions = all_questions(course_code, exam_name)
+    if exam_name:
+        stats = models.Stats.exam(user, course_code, exam_name)
+    else:
+        stats = models.Stats.course(user, course_code)
+    answered = correct = 0
+    for question_id, question_correct in stats.with_entities(models.Stats.question_id, models.Stats.correct):
+        index = position(questions, question_id)
+        # Questions in hidden exams are not part of the course
+        if index is not None:
+            answered |= 1 << index
+            if question_correct:
+                correct |= 1 << index
+    return AnswerBits(answered, correct)
+
+
+def add_answer(bits, questions, question_id, correct):
+    """Bits with one more answer"""
+    index = position(questions, question_id)
+    if index is None:
+        return bits
+    return AnswerBits(bits.answered | 1 << index, bits.correct | int(bool(correct)) << index)
+
+
+def record_answer(user_id, course_code, exam_name, question_id, correct):
+    """
+        Adds a saved answer to the cached bits of the course and the exam.
+        Bits that are not cached are built from stats when needed instead
+    """
+    from memorizer.utils import all_questions
+    for scope in ((course_code, None), (course_code, exam_name)):
+        key = _key(user_id, *scope)
+        cached = cache.get(key)
+        if cached is None or cached[0] != content_version(*scope):
+            continue
+        bits = add_answer(AnswerBits(*cached[1:]), all_questions(*scope), question_id, correct)
+        cache.set(key, (cached[0],) + bits, timeout=CACHE_TIME)
+
+
+def forget_answers(user_ids, course_code=None):
+    """Drops cached bits after stats are reset or moved, for a course and its exams or every course"""
+    exams = models.Exam.query.join(models.Course).with_entities(models.Course.code, models.Exam.name)
+    if course_code:
+        exams = exams.filter(models.Course.code == course_code)
+    scopes = set()
+    for code, exam_name in exams:
+        scopes.update({(code, None), (code, exam_name)})
+    cache.delete_many(*(_key(user_id, *scope) for user_id in user_ids for scope in scopes))
+
+
+def random_unset(bits, size, skip=None):
+    """Uniformly random index below size without its bit set, ignoring skip. None if all are set"""
+    candidates = min(size, 32)
+    for _ in range(candidates):
+        index = random.randrange(size)
+        if index != skip and not bits >> index & 1:
+            return index
+    # Most bits are set: pick among the few that are not
+    unset = ~bits & ((1 << size) - 1)
+    if skip is not None:
+        unset &= ~(1 << skip)
+    count = popcount(unset)
+    if not count:
+        return None
+    # Bit strings are read from the end, index 0 is the last character
+    digits = bin(unset)
+    index = len(digits)
+    for _ in range(random.randrange(count) + 1):
+        index = digits.rindex('1', 0, index)
+    return len(digits) - 1 - index
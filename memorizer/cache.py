@@ -1,5 +1,13 @@
+import time
+from collections import defaultdict
+from functools import wraps
+from itertools import chain
+
 from flask_caching import Cache
+from flask_caching.backends.base import BaseCache
+from sqlalchemy import event, inspect, or_
 
+from memorizer import models
 from memorizer.config import CACHE_REDIS_URL, CACHE_TYPE
 
 cache = Cache(config={
@@ -7,3 +15,167 @@ cache = Cache(config={
     'CACHE_KEY_PREFIX': 'memorizer',
     'CACHE_REDIS_URL': CACHE_REDIS_URL
 })
+
+
+QUESTION_COUNTS_KEY = 'version/question-counts'
+
+
+def content_changed(session, course_code, exam_name=None):
+    """Marks cached content as changed for writes the session listener does not see, like bulk inserts"""
+    scopes = session.info.setdefault('content_scopes', set())
+    scopes.update({(None, None), (course_code, None), (course_code, exam_name)})
+    session.info['question_counts_changed'] = True
+
+
+def _version_key(course_code, exam_name):
+    return 'version/{}/{}'.format(course_code or '', exam_name or '')
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        # Starting at the current time keeps versions increasing if the counter is evicted
+        cache.add(key, int(time.time() * 1000), timeout=0)
+        version = cache.get(key)
+    return version
+
+
+def _bump(key):
+    version = cache.get(key)
+    # A missing counter starts at a newer version when it is read
+    if version is None:
+        return
+    if type(cache.cache).inc is not BaseCache.inc:
+        # Atomic, and keeps the counter's lack of a timeout
+        cache.cache.inc(key)
+    else:
+        # The generic inc sets the counter again with the default timeout
+        cache.set(key, version + 1, timeout=0)
+
+
+def content_version(course_code=None, exam_name=None):
+    """Version of the cached content for an exam, a course or (without arguments) everything"""
+    return _version(_version_key(course_code, exam_name))
+
+
+def bump_version(course_code=None, exam_name=None):
+    _bump(_version_key(course_code, exam_name))
+
+
+def question_counts_version():
+    """Version of the number of questions per course, which only changes with questions or hidden exams"""
+    return _version(QUESTION_COUNTS_KEY)
+
+
+def memoize_scoped(timeout=None):
+    """
+        Memoizes a function taking (course_code, exam_name, ...) until content in
+        the course or exam changes, without clearing anything else
+    """
+    def decorator(f):
+        def versioned(version, *args, **kwargs):
+            return f(*args, **kwargs)
+        # Memoize keys are named after the function
+        versioned.__module__ = f.__module__
+        versioned.__name__ = versioned.__qualname__ = f.__qualname__
+        versioned = cache.memoize(timeout)(versioned)
+
+        @wraps(f)
+        def decorated_function(course_code, exam_name=None, *args, **kwargs):
+            version = content_version(course_code, exam_name)
+            return versioned(version, course_code, exam_name, *args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def _history_values(obj, key):
+    history = inspect(obj).attrs[key].history
+    values = {value for value in chain(history.added or (), history.unchanged or (), history.deleted or ())}
+    if not values:
+        # Not loaded, like for an expired object being deleted
+        values = {getattr(obj, key)}
+    return values - {None}
+
+
+def _changed_content(session):
+    for obj in chain(session.new, session.deleted, session.dirty):
+        if not isinstance(obj, (models.Course, models.Exam, models.Question, models.Alternative)):
+            continue
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        yield obj
+
+
+def _changes_question_counts(session, obj):
+    """If a change adds, removes or moves a question, or hides, shows or moves an exam"""
+    if isinstance(obj, models.Question):
+        return obj in session.new or obj in session.deleted or inspect(obj).attrs.exam_id.history.has_changes()
+    if isinstance(obj, models.Exam):
+        # New exams have no questions yet
+        if obj in session.new:
+            return False
+        attrs = inspect(obj).attrs
+        return obj in session.deleted or attrs.hidden.history.has_changes() or attrs.course_id.history.has_changes()
+    return False
+
+
+@event.listens_for(models.db.session, 'before_flush')
+def collect_content_scopes(session, flush_context, instances):
+    """Remembers which courses and exams are affected by content being added, changed or removed"""
+    changed = list(_changed_content(session))
+    if not changed:
+        return
+    if any(_changes_question_counts(session, obj) for obj in changed):
+        session.info['question_counts_changed'] = True
+    question_ids = set()
+    exam_ids = set()
+    # Course id -> names of affected exams and codes the course is known by
+    exam_names = defaultdict(set)
+    course_codes = defaultdict(set)
+    for obj in changed:
+        if isinstance(obj, models.Alternative):
+            question_ids |= _history_values(obj, 'question_id')
+        elif isinstance(obj, models.Question):
+            exam_ids |= _history_values(obj, 'exam_id')
+        elif isinstance(obj, models.Exam):
+            for course_id in _history_values(obj, 'course_id'):
+                exam_names[course_id] |= _history_values(obj, 'name')
+        else:
+            course_codes[obj.id] |= _history_values(obj, 'code')
+    _add_scopes(session, question_ids, exam_ids, exam_names, course_codes)
+
+
+def _add_scopes(session, question_ids, exam_ids, exam_names, course_codes):
+    if question_ids:
+        questions = session.query(models.Question.exam_id).filter(models.Question.id.in_(question_ids))
+        exam_ids.update(exam_id for exam_id, in questions)
+    exams = session.query(models.Exam.course_id, models.Exam.name).filter(or_(
+        models.Exam.id.in_(exam_ids),
+        # Every exam of a changed course
+        models.Exam.course_id.in_(course_id for course_id in course_codes if course_id)
+    ))
+    for course_id, exam_name in exams:
+        exam_names[course_id].add(exam_name)
+    courses = session.query(models.Course.id, models.Course.code).filter(models.Course.id.in_(exam_names))
+    for course_id, course_code in courses:
+        course_codes[course_id].add(course_code)
+    scopes = session.info.setdefault('content_scopes', set())
+    scopes.add((None, None))
+    for course_id, codes in course_codes.items():
+        for course_code in codes:
+            scopes.add((course_code, None))
+            scopes.update((course_code, exam_name) for exam_name in exam_names[course_id])
+
+
+@event.listens_for(models.db.session, 'after_commit')
+def invalidate_content_scopes(session):
+    for course_code, exam_name in session.info.pop('content_scopes', ()):
+        bump_version(course_code, exam_name)
+    if session.info.pop('question_counts_changed', False):
+        _bump(QUESTION_COUNTS_KEY)
+
+
+@event.listens_for(models.db.session, 'after_rollback')
+def discard_content_scopes(session):
+    session.info.pop('content_scopes', None)
+    session.info.pop('question_counts_changed', None)
@@ -0,0 +1,108 @@
+"""
+    Lookups of courses by code and exams by course code and name.
+
+    The ids of every course and exam are cached for the whole app until
+    content changes, and the models found are kept for the rest of the request.
+    Question counts are cached separately, until questions are added, removed
+    or moved or an exam is hidden or shown
+"""
+from collections import namedtuple
+
+from flask import abort, g, has_app_context
+from sqlalchemy import func
+
+from memorizer import models
+from memorizer.cache import cache, content_version, question_counts_version
+from memorizer.config import CACHE_TIME
+
+# courses: code -> course id, exams: (code, name) -> exam id, course_exams: code -> exam ids
+Catalogue = namedtuple('Catalogue', 'courses exams course_exams')
+
+
+@cache.memoize(CACHE_TIME)
+def _catalogue(version):
+    courses = {}
+    exams = {}
+    course_exams = {}
+    rows = models.db.session.query(models.Course.id, models.Course.code, models.Exam.id, models.Exam.name)\
+        .outerjoin(models.Exam, models.Exam.course_id == models.Course.id)\
+        .order_by(None)
+    for course_id, code, exam_id, exam_name in rows:
+        courses[code] = course_id
+        course_exams.setdefault(code, [])
+        if exam_id is not None:
+            exams[code, exam_name] = exam_id
+            course_exams[code].append(exam_id)
+    return Catalogue(courses, exams, course_exams)
+
+
+@cache.memoize(CACHE_TIME)
+def _question_counts(version):
+    """Course id -> number of questions outside hidden exams, by id so renaming a course keeps them"""
+    return dict(
+        models.db.session.query(models.Exam.course_id, func.count(models.Question.id))
+        .join(models.Question, models.Question.exam_id == models.Exam.id)
+        .filter(models.Exam.hidden.is_(False))
+        .group_by(models.Exam.course_id)
+        .order_by(None)
+    )
+
+
+def catalogue():
+    return _catalogue(content_version())
+
+
+def _found():
+    """Models found during this request, dropped if content changes meanwhile"""
+    version = content_version()
+    if not has_app_context():
+        return version, {}
+    found = getattr(g, 'catalogue_found', None)
+    if found is None or found[0] != version:
+        found = g.catalogue_found = version, {}
+    return found
+
+
+def _find(key, model, model_id):
+    version, found = _found()
+    if key not in found:
+        found[key] = models.db.session.query(model).get(model_id) if model_id is not None else None
+    return found[key]
+
+
+def find_course(code):
+    """The course with a code, or None"""
+    return _find(('course', code), models.Course, catalogue().courses.get(code))
+
+
+def find_exam(course_code, exam_name):
+    """The exam of a course by name, or None"""
+    return _find(('exam', course_code, exam_name), models.Exam, catalogue().exams.get((course_code, exam_name)))
+
+
+def exam_id(course_code, exam_name):
+    return catalogue().exams.get((course_code, exam_name))
+
+
+def course_exam_ids(course_code):
+    """Ids of every exam in a course, hidden or not"""
+    return catalogue().course_exams.get(course_code, [])
+
+
+def question_count(course_code):
+    """Number of questions in a course, not counting hidden exams"""
+    return _question_counts(question_counts_version()).get(catalogue().courses.get(course_code), 0)
+
+
+def course_or_404(code):
+    course = find_course(code)
+    if course is None:
+        abort(404)
+    return course
+
+
+def exam_or_404(course_code, exam_name):
+    exam = find_exam(course_code, exam_name)
+    if exam is None:
+        abort(404)
+    return exam
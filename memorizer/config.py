@@ -10,6 +10,20 @@ PERMAMENT_SESSION_LIFETIME = timedelta(days=60)  # around two months
 
 SQLALCHEMY_DATABASE_URI = 'sqlite:///' + join(PROJECT_PATH, 'memorizer.db')
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+# Run in order on every new SQLite connection, see https://www.sqlite.org/pragma.html
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,  # milliseconds to wait for a lock before giving up, first as the others may wait
+    'journal_mode': 'WAL',  # readers don't wait for writers, and writers don't wait for readers
+    'synchronous': 'NORMAL',  # safe with WAL, only checkpoints wait for the disk
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # negative is in kibibytes
+}
+SQLITE_POOL_SIZE = 5  # connections kept open to a database file, 0 opens one per request
+
+# Version history: 'sync' saves the versions of bulk inserts (like imports) along with the rows, 'off' keeps
+# no history at all
+VERSIONING = 'sync'
+UNVERSIONED_MODELS = []  # model names without history, e.g. ['Alternative']
 
 # Cache
 CACHE_TIME = 60 * 60 * 2  # 2 hours, pretty arbitrary
@@ -17,6 +31,23 @@ CACHE_TYPE = 'simple'
 # If redis is used
 CACHE_REDIS_URL = 'redis://localhost:6379'
 
+# Write-behind answers: saved to the journal right away and to the database in batches
+ANSWER_WRITE_BEHIND = False
+# Each process writes its own journal, named after ANSWER_JOURNAL and its process id
+ANSWER_JOURNAL = join(PROJECT_PATH, 'answers.journal')
+ANSWER_FLUSH_INTERVAL = 200  # milliseconds
+ANSWER_FLUSH_ROWS = 100
+
+# Question lists are served from static JSON files in SNAPSHOT_DIR, rebuilt when content changes. The API
+# redirects to them when on. Set USE_X_SENDFILE to let the web server send them
+QUESTION_SNAPSHOTS = False
+SNAPSHOT_DIR = join(PROJECT_PATH, 'snapshots')
+
+# SQL metrics per endpoint, shown on /admin/metrics
+SQL_METRICS = True
+SLOW_QUERY_THRESHOLD = 100  # milliseconds, slower statements are logged
+SQL_METRICS_SLOWEST = 5  # statements kept per endpoint
+
 try:
     from memorizer.localconfig import *  # NOQA
 except ImportError:
@@ -1,6 +1,8 @@
 from flask import _request_ctx_stack
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy_continuum import make_versioned
+from flask_sqlalchemy import SQLAlchemy as BaseSQLAlchemy
+from sqlalchemy import event, orm
+from sqlalchemy.pool import QueuePool, StaticPool
+from sqlalchemy_continuum import Operation, make_versioned, version_class, versioning_manager
 from sqlalchemy_continuum.plugins import FlaskPlugin
 from sqlalchemy_utils import force_auto_coercion
 
@@ -14,7 +16,122 @@ def fetch_current_user_id():
     return getattr(get_user(), 'id', None)
 
 
+def set_pragmas(pragmas):
+    """Engine connect listener running PRAGMA statements on every new connection"""
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+        cursor.close()
+    return connect
+
+
+class SQLAlchemy(BaseSQLAlchemy):
+    """
+        Sets up SQLite connections with SQLITE_PRAGMAS, and keeps SQLITE_POOL_SIZE
+        connections to a database file open instead of opening one per request
+    """
+    def apply_driver_hacks(self, app, sa_url, options):
+        super().apply_driver_hacks(app, sa_url, options)
+        if sa_url.drivername != 'sqlite':
+            return
+        options['sqlite_pragmas'] = app.config.get('SQLITE_PRAGMAS') or {}
+        pool_size = app.config.get('SQLITE_POOL_SIZE')
+        # In-memory databases already share a single connection
+        if options.get('poolclass') is not StaticPool and pool_size:
+            options.update(poolclass=QueuePool, pool_size=pool_size)
+            # Pooled connections are used by one thread at a time, but not always the same one
+            options.setdefault('connect_args', {})['check_same_thread'] = False
+
+    def create_engine(self, sa_url, engine_opts):
+        pragmas = engine_opts.pop('sqlite_pragmas', None)
+        engine = super().create_engine(sa_url, engine_opts)
+        if pragmas:
+            event.listen(engine, 'connect', set_pragmas(pragmas))
+        return engine
+
+
 db = SQLAlchemy()
 
 force_auto_coercion()
 make_versioned(plugins=[FlaskPlugin(current_user_id_factory=fetch_current_user_id)])
+
+
+class VersioningPolicy:
+    """
+        Which models keep a version history, set with UNVERSIONED_MODELS, and if any history
+        is kept, set with VERSIONING: 'sync' to save versions along with the rows, including
+        rows written in bulk, or 'off' to keep no history at all
+    """
+    MODES = ('sync', 'off')
+
+    def __init__(self):
+        self.mode = 'sync'
+        self.unversioned = set()
+
+    def init_app(self, app):
+        mode = app.config.get('VERSIONING', 'sync')
+        if mode not in self.MODES:
+            raise ValueError('VERSIONING must be one of {}, not {!r}'.format(', '.join(self.MODES), mode))
+        self.mode = mode
+        self.unversioned = set(app.config.get('UNVERSIONED_MODELS', ()))
+        # Version classes are built when mappers are configured, and not for models with versioning off
+        orm.configure_mappers()
+        versioning_manager.options['versioning'] = mode != 'off'
+        for model in versioning_manager.version_class_map:
+            model.__versioned__['versioning'] = self.versioned(model)
+
+    def versioned(self, model):
+        return self.mode != 'off' and model.__name__ not in self.unversioned
+
+
+versioning_policy = VersioningPolicy()
+
+
+def bulk_transaction(session):
+    """
+        The version transaction for rows written with bulk inserts, which SQLAlchemy-Continuum
+        does not see. Created once per database transaction
+    """
+    transaction = session.info.get('bulk_transaction')
+    if transaction is not None:
+        return transaction
+    # Shared with the versions SQLAlchemy-Continuum has written in this transaction, like of a new exam
+    transaction = versioning_manager.unit_of_work(session).current_transaction
+    if transaction is not None:
+        session.info['bulk_transaction'] = transaction
+        return transaction
+    transaction = versioning_manager.transaction_cls()
+    for plugin in versioning_manager.plugins:
+        for key, value in plugin.transaction_args(None, session).items():
+            setattr(transaction, key, value)
+    session.add(transaction)
+    session.flush()
+    session.info['bulk_transaction'] = transaction
+    return transaction
+
+
+def insert_versions(session, model, mappings):
+    transaction = bulk_transaction(session)
+    session.bulk_insert_mappings(version_class(model), [
+        dict(mapping, transaction_id=transaction.id, operation_type=Operation.INSERT) for mapping in mappings
+    ])
+
+
+def bulk_insert_versioned(session, model, mappings, return_defaults=False):
+    """
+        Inserts rows in bulk and saves their versions as the versioning policy says.
+        The ids of the mappings are filled in when versions are kept or return_defaults is set
+    """
+    if not versioning_policy.versioned(model):
+        session.bulk_insert_mappings(model, mappings, return_defaults=return_defaults)
+        return
+    # Versions need the ids, which takes a statement per row
+    session.bulk_insert_mappings(model, mappings, return_defaults=True)
+    insert_versions(session, model, mappings)
+
+
+@event.listens_for(db.session, 'after_commit')
+@event.listens_for(db.session, 'after_rollback')
+def forget_bulk_transaction(session):
+    session.info.pop('bulk_transaction', None)
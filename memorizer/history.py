@@ -0,0 +1,201 @@
+"""
+    Version history of courses, exams and questions, a page at a time.
+
+    Versions are loaded with their transactions and users in one query, and
+    changesets are computed from neighbouring versions of the page instead of
+    querying for the previous version of each.
+
+    History older than a retention window can be compacted: the versions of
+    an object before the window are squashed into the last of them, and the
+    transactions left without versions are removed
+"""
+import math
+from datetime import datetime, timedelta
+
+from flask_script import Command, Manager, Option
+from sqlalchemy import and_, bindparam, distinct, exists, orm
+from sqlalchemy_continuum import Operation, version_class
+from sqlalchemy_continuum.utils import is_internal_column
+
+from memorizer import models
+from memorizer.database import db, versioning_manager
+from memorizer.utils import datetimeformat
+
+VERSIONED = {
+    'courses': models.Course,
+    'exams': models.Exam,
+    'questions': models.Question,
+}
+PER_PAGE = 20
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def changeset(version, previous):
+    """Fields changed in a version compared to the one before it, as [field, before, after]"""
+    changes = []
+    for key in orm.class_mapper(version.__class__).columns.keys():
+        if is_internal_column(version, key):
+            continue
+        before = getattr(previous, key) if previous else None
+        after = getattr(version, key)
+        if before != after:
+            changes.append([key, _text(before), _text(after)])
+    return changes
+
+
+def history_page(model, object_id, page=1, per_page=PER_PAGE):
+    """Versions of an object, newest first, with paging information"""
+    version_cls = version_class(model)
+    versions = version_cls.query.filter_by(id=object_id)
+    total = versions.count()
+    # One extra version to compare the oldest on the page with
+    page_versions = versions\
+        .options(orm.joinedload(version_cls.transaction).joinedload(versioning_manager.transaction_cls.user))\
+        .order_by(version_cls.transaction_id.desc())\
+        .offset((page - 1) * per_page)\
+        .limit(per_page + 1)\
+        .all()
+    serialized = []
+    for index, version in enumerate(page_versions[:per_page]):
+        previous = page_versions[index + 1] if index + 1 < len(page_versions) else None
+        transaction = version.transaction
+        serialized.append({
+            'number': total - (page - 1) * per_page - index,
+            'transaction_id': version.transaction_id,
+            'issued_at': datetimeformat(transaction.issued_at) if transaction.issued_at else None,
+            'user': _text(transaction.user),
+            'changes': changeset(version, previous),
+        })
+    return {
+        'page': page,
+        'pages': math.ceil(total / per_page),
+        'total': total,
+        'versions': serialized,
+    }
+
+
+def used_bytes():
+    """Bytes used by a SQLite database, None for other databases"""
+    if db.session.bind.dialect.name != 'sqlite':
+        return None
+    page_size, page_count, free_pages = (
+        db.session.execute('PRAGMA {}'.format(pragma)).scalar()
+        for pragma in ('page_size', 'page_count', 'freelist_count')
+    )
+    return (page_count - free_pages) * page_size
+
+
+def squash(rows):
+    """
+        Versions to remove and to mark as inserts from the old versions of one
+        object, as (transaction_id, operation_type) ordered by transaction
+    """
+    *older, (last_transaction, last_operation) = rows
+    # Everything before the deletion of an object is gone with it
+    if last_operation == Operation.DELETE:
+        return [transaction_id for transaction_id, operation in rows], None
+    # The version kept is now the first, and stands for the insert
+    inserted = older and older[0][1] == Operation.INSERT and last_operation != Operation.INSERT
+    return [transaction_id for transaction_id, operation in older], last_transaction if inserted else None
+
+
+def compact_versions(model, cutoff, batch_size):
+    """Squashes the versions of a model issued before cutoff, a batch of objects per commit. Returns rows removed"""
+    version_cls = version_class(model)
+    table = version_cls.__table__
+    transaction_cls = versioning_manager.transaction_cls
+    delete = table.delete().where(and_(
+        table.c.id == bindparam('object_id'), table.c.transaction_id == bindparam('version_transaction_id')
+    ))
+    mark_insert = table.update().where(and_(
+        table.c.id == bindparam('object_id'), table.c.transaction_id == bindparam('version_transaction_id')
+    )).values(operation_type=Operation.INSERT)
+    removed = 0
+    last_id = None
+    while True:
+        ids = db.session.query(distinct(version_cls.id))
+        if last_id is not None:
+            ids = ids.filter(version_cls.id > last_id)
+        ids = [object_id for object_id, in ids.order_by(version_cls.id).limit(batch_size)]
+        if not ids:
+            return removed
+        last_id = ids[-1]
+        rows = db.session.query(version_cls.id, version_cls.transaction_id, version_cls.operation_type)\
+            .join(transaction_cls, transaction_cls.id == version_cls.transaction_id)\
+            .filter(version_cls.id.in_(ids), transaction_cls.issued_at < cutoff)\
+            .order_by(version_cls.id, version_cls.transaction_id)
+        versions = {}
+        for object_id, transaction_id, operation in rows:
+            versions.setdefault(object_id, []).append((transaction_id, operation))
+        deleted = []
+        inserted = []
+        for object_id, object_versions in versions.items():
+            removed_ids, inserted_id = squash(object_versions)
+            deleted.extend({'object_id': object_id, 'version_transaction_id': id} for id in removed_ids)
+            if inserted_id is not None:
+                inserted.append({'object_id': object_id, 'version_transaction_id': inserted_id})
+        if deleted:
+            db.session.execute(delete, deleted)
+        if inserted:
+            db.session.execute(mark_insert, inserted)
+        db.session.commit()
+        removed += len(deleted)
+
+
+def compact_transactions(cutoff, batch_size):
+    """Removes transactions issued before cutoff without versions left, an id range per commit. Returns rows removed"""
+    transaction_cls = versioning_manager.transaction_cls
+    unused = and_(*(
+        ~exists().where(version_cls.transaction_id == transaction_cls.id)
+        for version_cls in versioning_manager.version_class_map.values()
+    ))
+    removed = 0
+    last_id = None
+    while True:
+        ids = db.session.query(transaction_cls.id).filter(transaction_cls.issued_at < cutoff)
+        if last_id is not None:
+            ids = ids.filter(transaction_cls.id > last_id)
+        ids = [transaction_id for transaction_id, in ids.order_by(transaction_cls.id).limit(batch_size)]
+        if not ids:
+            return removed
+        removed += db.session.query(transaction_cls)\
+            .filter(transaction_cls.id.between(ids[0], ids[-1]), transaction_cls.issued_at < cutoff, unused)\
+            .delete(synchronize_session=False)
+        db.session.commit()
+        last_id = ids[-1]
+
+
+def compact_history(days, batch_size=500):
+    """Compacts history older than a number of days, returns the rows removed per table and the bytes freed"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    before = used_bytes()
+    removed = {}
+    for model, version_cls in versioning_manager.version_class_map.items():
+        removed[version_cls.__table__.name] = compact_versions(model, cutoff, batch_size)
+    removed[versioning_manager.transaction_cls.__table__.name] = compact_transactions(cutoff, batch_size)
+    after = used_bytes()
+    return removed, before - after if before is not None else None
+
+
+class CompactCommand(Command):
+    'Squash version history older than a retention window'
+
+    option_list = (
+        Option('--days', type=int, default=180, help='history to keep untouched (default: 180)'),
+        Option('--batch-size', type=int, default=500, help='objects or transactions per commit (default: 500)'),
+    )
+
+    def run(self, days, batch_size):
+        removed, freed = compact_history(days, batch_size)
+        for table, rows in removed.items():
+            print('{}: removed {} rows'.format(table, rows))
+        print('Removed {} rows, freed {}'.format(
+            sum(removed.values()), 'unknown bytes' if freed is None else '{} bytes'.format(freed)
+        ))
+
+
+HistoryCommand = Manager(usage='Maintain version history')
+HistoryCommand.add_command('compact', CompactCommand)
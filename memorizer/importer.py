@@ -1,63 +1,154 @@
 import argparse
 import json
+import multiprocessing
+import queue
+import time
 
 from flask_script import Command, Option
+from sqlalchemy.exc import IntegrityError
 
-from memorizer import models
-from memorizer.database import db
+from memorizer import jsonstream, models
+from memorizer.cache import content_changed
+from memorizer.database import bulk_insert_versioned, db
+
+BATCH_SIZE = 500
+HEADER_KEYS = {'code', 'name', 'exam'}
 
 
 class ValidationError(Exception):
     pass
 
 
-def import_question(question, exam):
-    image = question.get('image', '')
+def question_mapping(question, exam):
     if 'answers' in question:
         question_type = models.Question.MULTIPLE
         answer = None
     else:
         question_type = models.Question.BOOLEAN
         answer = question['answer']
-    question_object = models.Question(question_type, question['question'], exam.id, image, answer)
-    db.session.add(question_object)
-    db.session.commit()
-    if question_type != models.Question.MULTIPLE:
-        return
-    for number, answer in enumerate(question['answers']):
-        if type(question['correct']) is int and question['correct'] == number:
-            correct = True
-        elif type(question['correct']) is list and number in question['correct']:
-            correct = True
-        else:
-            correct = False
-        alternative = models.Alternative(answer, correct, question_object.id)
-        db.session.add(alternative)
-    db.session.commit()
+    return {
+        'type': question_type,
+        'text': question['question'],
+        'exam_id': exam.id,
+        'image': question.get('image', ''),
+        'correct': answer
+    }
 
 
-def import_exam(exam_json):
-    # Will raise exception if error found
-    validate_exam(exam_json)
-    # Get or create course
+def alternative_mappings(question, question_id):
+    if 'answers' not in question:
+        return []
+    correct_answers = question['correct'] if type(question['correct']) is list else [question['correct']]
+    return [
+        {'text': answer, 'correct': number in correct_answers, 'question_id': question_id}
+        for number, answer in enumerate(question['answers'])
+    ]
+
+
+def import_questions(questions, exam):
+    """
+        Inserts validated questions with their alternatives and versions in bulk,
+        returns the number of questions and alternatives added
+    """
+    question_rows = [question_mapping(question, exam) for question in questions]
+    # Alternatives need the question ids
+    bulk_insert_versioned(db.session, models.Question, question_rows, return_defaults=True)
+    alternative_rows = [
+        alternative
+        for question, row in zip(questions, question_rows)
+        for alternative in alternative_mappings(question, row['id'])
+    ]
+    bulk_insert_versioned(db.session, models.Alternative, alternative_rows)
+    content_changed(db.session, exam.course.code, exam.name)
+    return len(question_rows) + len(alternative_rows)
+
+
+def get_exam(exam_json):
+    """
+        Gets or creates the course and exam, saved along with the questions.
+        Has to be the first write in the transaction, as it is rolled back
+        if another import creates the course or exam at the same time
+    """
     course = models.Course.query.filter_by(code=exam_json['code']).first()
     if not course:
         course = models.Course(exam_json['code'], exam_json['name'])
         db.session.add(course)
-        db.session.commit()
-    # Get or create exam
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            course = models.Course.query.filter_by(code=exam_json['code']).one()
     exam = models.Exam.query.filter_by(name=exam_json['exam'], course=course).first()
     if not exam:
         exam = models.Exam(exam_json['exam'], course.id)
         db.session.add(exam)
-        db.session.commit()
-    questions = exam_json['questions']
-    for question_json in questions:
-        import_question(question_json, exam)
-    return True
+        try:
+            db.session.flush()
+        except IntegrityError:
+            # Both were created by the other import if the course was new
+            db.session.rollback()
+            course = models.Course.query.filter_by(code=exam_json['code']).one()
+            exam = models.Exam.query.filter_by(name=exam_json['exam'], course=course).one()
+    return exam
+
+
+def import_exam(exam_json):
+    """Imports an exam in a single transaction, returns the number of rows added"""
+    # Will raise exception if error found
+    validate_exam(exam_json)
+    exam = get_exam(exam_json)
+    rows = import_questions(exam_json['questions'], exam)
+    db.session.commit()
+    return rows
+
+
+def import_exam_stream(fields, batch_size=BATCH_SIZE):
+    """
+        Imports an exam from (key, value) pairs as produced by jsonstream, validating
+        and inserting questions in batches so only one batch is kept in memory.
+        Questions listed before the course and exam fields are held until they are known.
+        Everything is committed at the end, or rolled back if a question is invalid.
+        Returns the number of rows added
+    """
+    header = {}
+    batch = []
+    exam = None
+    rows = 0
+    questions = 0
+    try:
+        for key, value in fields:
+            if key != 'questions':
+                header[key] = value
+                continue
+            _validate_listed_question(value)
+            batch.append(value)
+            questions += 1
+            if exam is None and HEADER_KEYS <= header.keys():
+                validate_header(header)
+                exam = get_exam(header)
+            if exam is not None and len(batch) >= batch_size:
+                rows += import_questions(batch, exam)
+                batch = []
+        validate_header(header)
+        if not questions:
+            raise ValidationError('there must be at least one question')
+        if exam is None:
+            exam = get_exam(header)
+        if batch:
+            rows += import_questions(batch, exam)
+    except Exception:
+        db.session.rollback()
+        raise
+    db.session.commit()
+    return rows
 
 
 def validate_exam(exam_json):
+    validate_header(exam_json)
+    validate_questions(exam_json)
+
+
+def validate_header(exam_json):
     # Exam name and course code has to present
     if 'code' not in exam_json:
         raise ValidationError('subject code missing')
@@ -77,7 +168,6 @@ def validate_exam(exam_json):
         raise ValidationError('Exam name must be text')
     if len(exam_json['exam']) == 0:
         raise ValidationError('exam name cannot be empty')
-    validate_questions(exam_json)
 
 
 def validate_questions(exam_json):
@@ -89,11 +179,17 @@ def validate_questions(exam_json):
         raise ValidationError('there must be at least one question')
     questions = exam_json['questions']
     for question in questions:
-        try:
-            validate_question(question)
-        except ValidationError as e:
-            # Reraising with more information
-            raise ValidationError('{}: {}'.format(e, question.get('question')))
+        _validate_listed_question(question)
+
+
+def _validate_listed_question(question):
+    if type(question) is not dict:
+        raise ValidationError('questions must be objects')
+    try:
+        validate_question(question)
+    except ValidationError as e:
+        # Reraising with more information
+        raise ValidationError('{}: {}'.format(e, question.get('question')))
 
 
 def _validate_alternative(answer):
@@ -149,17 +245,147 @@ def validate_question(question):
         raise ValidationError('answers are missing')
 
 
+def read_fields(file, path):
+    """A question file as (key, value) pairs, streaming the questions"""
+    if not path.endswith('.jsonl'):
+        return jsonstream.iter_fields(file, 'questions')
+    return _read_lines(file)
+
+
+def _read_lines(file):
+    try:
+        yield from jsonstream.iter_lines(file, 'questions')
+    except jsonstream.NotAnObjectError as e:
+        raise ValidationError(str(e))
+
+
+def read_file(path):
+    """Opens a question file as (key, value) pairs, closing it when they are read"""
+    with open(path, encoding='utf-8') as file:
+        yield from read_fields(file, path)
+
+
+def validate_fields(fields):
+    """Validates the fields of a question file without keeping the questions, returns the course and exam fields"""
+    header = {}
+    questions = 0
+    for key, value in fields:
+        if key == 'questions':
+            _validate_listed_question(value)
+            questions += 1
+        else:
+            header[key] = value
+    validate_header(header)
+    if not questions:
+        raise ValidationError('there must be at least one question')
+    return header
+
+
+def validate_file(path):
+    return validate_fields(read_file(path))
+
+
+def parse_file(path, batch_size, messages):
+    """Runs in an import worker: validates a file, then sends its fields and question batches to the writer"""
+    try:
+        with open(path, encoding='utf-8') as file:
+            messages.put(('header', path, validate_fields(read_fields(file, path))))
+            # Read again now that it is known to be valid
+            file.seek(0)
+            batch = []
+            for key, value in read_fields(file, path):
+                if key != 'questions':
+                    continue
+                batch.append(value)
+                if len(batch) >= batch_size:
+                    messages.put(('batch', path, batch))
+                    batch = []
+            if batch:
+                messages.put(('batch', path, batch))
+        messages.put(('done', path, None))
+    except (ValidationError, ValueError, OSError) as e:
+        messages.put(('error', path, str(e)))
+
+
+def import_files_parallel(paths, processes=None, batch_size=BATCH_SIZE):
+    """
+        Parses and validates files in a process pool while this process is the only one
+        writing to the database, committing every batch. Returns the paths that failed
+    """
+    failed = []
+    exams = {}
+    progress = {}
+    with multiprocessing.Manager() as manager, multiprocessing.Pool(processes) as pool:
+        messages = manager.Queue()
+        results = {path: pool.apply_async(parse_file, (path, batch_size, messages)) for path in paths}
+        remaining = set(paths)
+        while remaining:
+            try:
+                kind, path, payload = messages.get(timeout=1)
+            except queue.Empty:
+                # Workers report their own errors, this only catches crashes
+                for path in list(remaining):
+                    if results[path].ready() and not results[path].successful():
+                        print(path, 'failed')
+                        failed.append(path)
+                        remaining.discard(path)
+                continue
+            if kind == 'header':
+                exams[path] = get_exam(payload)
+                db.session.commit()
+                progress[path] = [0, time.perf_counter()]
+            elif kind == 'batch':
+                progress[path][0] += import_questions(payload, exams[path])
+                db.session.commit()
+            elif kind == 'done':
+                rows, start = progress[path]
+                print(path, end=': ')
+                print_rate(rows, time.perf_counter() - start)
+                remaining.discard(path)
+            else:
+                print(path, 'failed:', payload)
+                failed.append(path)
+                remaining.discard(path)
+    return failed
+
+
+def print_rate(rows, seconds):
+    print('{} rows in {:.2f}s ({} rows/sec)'.format(rows, seconds, int(rows / seconds) if seconds else rows))
+
+
 class ImportCommand(Command):
     'Import questions in JSON format'
 
     option_list = (
-        Option('filenames', nargs='+', type=argparse.FileType('r'), help='JSON question files'),
+        Option('filenames', nargs='+', type=argparse.FileType('r'), help='JSON or JSON Lines (.jsonl) question files'),
+        Option('--stream', action='store_true', help='parse JSON files incrementally instead of loading them'),
+        Option('--batch-size', type=int, default=BATCH_SIZE, help='questions inserted at a time when streaming'),
+        Option('--parallel', type=int, default=0, metavar='PROCESSES',
+               help='parse and validate files in this many processes'),
     )
 
-    def run(self, filenames):
+    def run(self, filenames, stream=False, batch_size=BATCH_SIZE, parallel=0):
         print("Importing questions...")
+        if parallel:
+            paths = []
+            for filename in filenames:
+                paths.append(filename.name)
+                filename.close()
+            start = time.perf_counter()
+            failed = import_files_parallel(paths, parallel, batch_size)
+            print('Imported', len(paths) - len(failed), 'of', len(paths), 'files in {:.2f}s'.format(
+                time.perf_counter() - start
+            ))
+            return 1 if failed else 0
         for filename in filenames:
-            exam_json = json.load(filename)
-            print('Importing questions from', exam_json['name'], exam_json['code'], 'exam', exam_json['exam'])
-            import_exam(exam_json)
+            start = time.perf_counter()
+            name = getattr(filename, 'name', '')
+            if name.endswith('.jsonl') or stream:
+                print('Importing questions from', name)
+                rows = import_exam_stream(read_fields(filename, name), batch_size)
+            else:
+                exam_json = json.load(filename)
+                print('Importing questions from', exam_json['name'], exam_json['code'], 'exam', exam_json['exam'])
+                rows = import_exam(exam_json)
+            print_rate(rows, time.perf_counter() - start)
         print("Importing completed")
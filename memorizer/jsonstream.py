@@ -0,0 +1,115 @@
+import json
+
+CHUNK_SIZE = 64 * 1024
+
+
+class NotAnObjectError(ValueError):
+    """The fields of a JSON Lines file are not an object"""
+
+
+class JSONReader:
+    """Reads JSON values one at a time from a file, keeping only a small buffer in memory"""
+    decoder = json.JSONDecoder()
+
+    def __init__(self, file, chunk_size=CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+
+    def read(self):
+        chunk = self.file.read(self.chunk_size)
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode('utf-8')
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        self.eof = not chunk
+
+    def peek(self):
+        """Returns the next non-whitespace character, or an empty string at the end of the file"""
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position].isspace():
+                self.position += 1
+            if self.position < len(self.buffer) or self.eof:
+                return self.buffer[self.position:self.position + 1]
+            self.read()
+
+    def expect(self, characters):
+        character = self.peek()
+        if not character or character not in characters:
+            raise json.JSONDecodeError('Expecting one of %r' % characters, self.buffer, self.position)
+        self.position += 1
+        return character
+
+    def end(self):
+        """Checks that only whitespace is left, like json.loads"""
+        if self.peek():
+            raise json.JSONDecodeError('Extra data', self.buffer, self.position)
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self.read()
+                continue
+            # A number at the end of the buffer might continue in the next chunk
+            if end == len(self.buffer) and not self.eof:
+                self.read()
+                continue
+            self.position = end
+            return value
+
+
+def iter_fields(file, stream_key, chunk_size=CHUNK_SIZE):
+    """
+        Parses a JSON object one field at a time, yielding (key, value).
+        The array in stream_key is never loaded as a whole, its items are yielded as (stream_key, item)
+    """
+    reader = JSONReader(file, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.expect('}')
+        reader.end()
+        return
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key == stream_key and reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.expect(']')
+            else:
+                while True:
+                    yield key, reader.value()
+                    if reader.expect(',]') == ']':
+                        break
+        else:
+            yield key, reader.value()
+        if reader.expect(',}') == '}':
+            reader.end()
+            return
+
+
+def iter_lines(file, stream_key):
+    """
+        Parses JSON Lines where the first line is an object of fields and every following line
+        is an item, yielding them like iter_fields
+    """
+    header = None
+    for line in file:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        if header is None:
+            header = json.loads(line)
+            if not isinstance(header, dict):
+                raise NotAnObjectError('the first line must be an object')
+            yield from header.items()
+        else:
+            yield stream_key, json.loads(line)
@@ -0,0 +1,103 @@
+"""
+    SQL statistics per request and per endpoint, collected from engine events.
+
+    Every response gets a Server-Timing header with the number of queries and
+    the time spent in the database, statements slower than SLOW_QUERY_THRESHOLD
+    milliseconds are logged along with the view, and totals per endpoint are
+    kept in memory for the admin metrics page
+"""
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class EndpointMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.time = 0.0
+        # Slowest statements as (milliseconds, statement)
+        self.slowest = []
+
+    @property
+    def queries_per_request(self):
+        return self.queries / self.requests if self.requests else 0
+
+    @property
+    def time_per_request(self):
+        return self.time / self.requests if self.requests else 0
+
+
+class SQLMetrics:
+    def __init__(self):
+        self.app = None
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.threshold = 100
+        self.keep_slowest = 5
+        self.listening = False
+
+    def init_app(self, app):
+        self.app = app
+        self.threshold = app.config.get('SLOW_QUERY_THRESHOLD', 100)
+        self.keep_slowest = app.config.get('SQL_METRICS_SLOWEST', 5)
+        if not app.config.get('SQL_METRICS', True):
+            return
+        if not self.listening:
+            event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+            self.listening = True
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+    def before_request(self):
+        g.sql_queries = 0
+        g.sql_time = 0.0
+        g.sql_slowest = None
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Kept on the statement's context, so nothing is left behind when it raises
+        if context is not None:
+            context._metrics_start = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_metrics_start', None)
+        # Only statements run while handling a request are counted
+        if start is None or not has_request_context() or 'sql_queries' not in g:
+            return
+        elapsed = (time.perf_counter() - start) * 1000
+        g.sql_queries += 1
+        g.sql_time += elapsed
+        if g.sql_slowest is None or elapsed > g.sql_slowest[0]:
+            g.sql_slowest = (elapsed, statement)
+        if elapsed >= self.threshold:
+            self.app.logger.warning('Slow query in %s (%.1f ms): %s', request.endpoint, elapsed, statement)
+
+    def after_request(self, response):
+        queries = g.pop('sql_queries', 0)
+        total = g.pop('sql_time', 0.0)
+        slowest = g.pop('sql_slowest', None)
+        response.headers.add('Server-Timing', 'db;dur={:.1f};desc="{} queries"'.format(total, queries))
+        with self.lock:
+            metrics = self.endpoints.setdefault(request.endpoint or 'unmatched', EndpointMetrics())
+            metrics.requests += 1
+            metrics.queries += queries
+            metrics.time += total
+            if slowest:
+                metrics.slowest = sorted(metrics.slowest + [slowest], reverse=True)[:self.keep_slowest]
+        return response
+
+    def summary(self):
+        """Endpoints ordered by the total time spent in the database"""
+        with self.lock:
+            return sorted(self.endpoints.items(), key=lambda item: item[1].time, reverse=True)
+
+    def reset(self):
+        with self.lock:
+            self.endpoints = {}
+
+
+sql_metrics = SQLMetrics()
@@ -1,5 +1,6 @@
 from flask import url_for
-from sqlalchemy import literal, orm
+from sqlalchemy import false, literal, orm, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy_utils.types.choice import ChoiceType
 from sqlalchemy_utils.types.password import PasswordType
@@ -25,16 +26,12 @@ class Course(db.Model):
 
     @cached_property
     def question_count(self):
-        return Question.query\
-            .filter_by(course=self).join(Question.exam)\
-            .filter(Exam.hidden.is_(False)).count()
+        from memorizer.catalogue import question_count
+        return question_count(self.code)
 
     def question(self, id):
-        return Question.query\
-            .filter_by(course=self)\
-            .join(Question.exam)\
-            .filter(Exam.hidden.is_(False))\
-            .offset(id - 1).limit(1)
+        from memorizer.utils import question_at
+        return question_at(self.code, None, id)
 
     def stats(self):
         from memorizer.utils import generate_stats
@@ -59,6 +56,7 @@ class Course(db.Model):
 class Exam(db.Model):
     __versioned__ = {}
     __tablename__ = 'exam'
+    __table_args__ = (db.Index('ix_exam_course_id_name', 'course_id', 'name', unique=True),)
     __mapper_args__ = {'order_by': 'name'}
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, info={'label': 'name'})
@@ -76,12 +74,14 @@ class Exam(db.Model):
 
     @cached_property
     def question_count(self):
-        return Question.query.filter_by(exam=self).count()
+        from memorizer.utils import max_questions_exam
+        return max_questions_exam(self.course.code, self.name)
 
     def question(self, id):
         if self.hidden:
             return None
-        return Question.query.filter_by(exam=self).offset(id - 1).limit(1)
+        from memorizer.utils import question_at
+        return question_at(self.course.code, self.name, id)
 
     def stats(self):
         from memorizer.utils import generate_stats
@@ -117,6 +117,7 @@ class Question(db.Model):
         (BOOLEAN, 'yes/no')
     ]
     __tablename__ = 'question'
+    __table_args__ = (db.Index('ix_question_exam_id_id', 'exam_id', 'id'),)
     __mapper_args__ = {'order_by': 'id'}
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.String, info={'label': 'text'})
@@ -156,8 +157,19 @@ class Question(db.Model):
 
     @classmethod
     def find_index(cls, question):
-        indexes = [q.id for q in cls.query.filter_by(exam_id=question.exam_id).all()]
-        return indexes.index(question.id) + 1
+        """Position within the exam, counted in the database so it is always in sync with the exam"""
+        return cls.query.filter(cls.exam_id == question.exam_id, cls.id <= question.id)\
+            .with_entities(db.func.count(cls.id)).order_by(None).scalar()
+
+    @classmethod
+    def serialize_all(cls, questions):
+        """Serializes a question query, loading exams, courses and alternatives in a fixed number of queries"""
+        questions = questions.options(
+            orm.joinedload(cls.exam).joinedload(Exam.course),
+            orm.selectinload(cls.alternatives)
+        )
+        serialized_objects = [question.serialize() for question in questions]
+        return [obj for obj in serialized_objects if obj is not None]
 
     def serialize(self):
         if self.exam.hidden:
@@ -191,6 +203,7 @@ class Question(db.Model):
 class Alternative(db.Model):
     __versioned__ = {}
     __tablename__ = 'alternative'
+    __table_args__ = (db.Index('ix_alternative_question_id_correct', 'question_id', 'correct'),)
     __mapper_args__ = {'order_by': 'id'}
 
     id = db.Column(db.Integer, primary_key=True)
@@ -236,6 +249,7 @@ class User(db.Model):
 
 class Stats(db.Model):
     __tablename__ = 'stats'
+    __table_args__ = (db.Index('ix_stats_user_id_reset_question_id', 'user_id', 'reset', 'question_id'),)
     __mapper_args__ = {'order_by': 'id'}
 
     id = db.Column(db.Integer, primary_key=True)
@@ -255,8 +269,11 @@ class Stats(db.Model):
 
     @classmethod
     def course(cls, user, course_code):
-        course_m = Course.query.filter_by(code=course_code).one_or_none()
-        questions = Question.query.filter_by(course=course_m)
+        from memorizer.catalogue import course_exam_ids
+        exam_ids = course_exam_ids(course_code)
+        if not exam_ids:
+            return cls.query.filter(false())
+        questions = Question.query.filter(Question.exam_id.in_(exam_ids))
         return cls.query.filter(
             Stats.reset.is_(False),
             Stats.user_id == user.id,
@@ -265,9 +282,11 @@ class Stats(db.Model):
 
     @classmethod
     def exam(cls, user, course_code, exam_name):
-        course_m = Course.query.filter_by(code=course_code).one_or_none()
-        exam_m = Exam.query.filter_by(course=course_m, name=exam_name).one_or_none()
-        questions = Question.query.filter_by(exam=exam_m)
+        from memorizer.catalogue import exam_id
+        exam_m = exam_id(course_code, exam_name)
+        if exam_m is None:
+            return cls.query.filter(false())
+        questions = Question.query.filter_by(exam_id=exam_m)
         return cls.query.filter(
             Stats.reset.is_(False),
             Stats.user_id == user.id,
@@ -276,7 +295,126 @@ class Stats(db.Model):
 
     @classmethod
     def answered(cls, user, question):
+        if user.id is None:
+            return False
         return cls.query.filter_by(user=user, question=question, reset=False).count() > 0
 
+    @classmethod
+    def add_once(cls, user, question_id, correct):
+        """Saves an answer unless the question is already answered, in one statement. Returns if it was saved"""
+        answered = db.session.query(cls.id).filter_by(user_id=user.id, question_id=question_id, reset=False)
+        values = select([literal(question_id), literal(user.id), literal(correct), literal(False)])\
+            .where(~answered.exists())
+        insert = cls.__table__.insert().from_select(['question_id', 'user_id', 'correct', 'reset'], values)
+        if db.session.bind.dialect.name == 'sqlite':
+            # Writes are serialized, so the check can't be outdated, and releasing a savepoint
+            # opened before the first write of a transaction would commit it
+            return db.session.execute(insert).rowcount > 0
+        try:
+            # Only the insert is undone if it conflicts
+            with db.session.begin_nested():
+                return db.session.execute(insert).rowcount > 0
+        except IntegrityError:
+            # Saved by a concurrent request, like a double click, since the check
+            return False
+
+    @classmethod
+    def move(cls, from_user, to_user):
+        """Moves all stats of an anonymous user to an account"""
+        # Answers to questions the account has answered already would count twice
+        answered = db.session.query(cls.question_id).filter_by(user_id=to_user.id, reset=False)
+        cls.query.filter(cls.user_id == from_user.id, cls.reset.is_(False), cls.question_id.in_(answered))\
+            .update({cls.reset: True}, synchronize_session=False)
+        cls.query.filter_by(user_id=from_user.id).update({cls.user_id: to_user.id}, synchronize_session=False)
+        StatsSummary.rebuild(from_user)
+        StatsSummary.rebuild(to_user)
+
+
+# A question has at most one current answer per user
+db.Index(
+    'ix_stats_user_id_question_id_current', Stats.user_id, Stats.question_id, unique=True,
+    sqlite_where=Stats.reset.is_(False), postgresql_where=Stats.reset.is_(False)
+)
+
+
+class StatsSummary(db.Model):
+    """
+        A user's current combo, correct answers in a row, for a course (exam_id is COURSE)
+        or a single exam. Totals are counted from the answer bitsets instead.
+        Course combos have a real exam_id so the unique constraint covers them, which is
+        why exam_id is not a foreign key
+    """
+    __tablename__ = 'stats_summary'
+    __table_args__ = (db.UniqueConstraint('user_id', 'course_id', 'exam_id'),)
+    COURSE = 0
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    exam_id = db.Column(db.Integer, nullable=False, default=COURSE)
+    combo = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, user_id=None, course_id=None, exam_id=COURSE, combo=0):
+        self.user_id = user_id
+        self.course_id = course_id
+        self.exam_id = exam_id
+        self.combo = combo
+
+    @classmethod
+    def find(cls, user, course_code, exam_name=None):
+        """Returns the summary for a course or exam, or an empty one if nothing has been answered"""
+        from memorizer.catalogue import catalogue
+        ids = catalogue()
+        course_id = ids.courses.get(course_code)
+        exam_id = ids.exams.get((course_code, exam_name)) if exam_name else cls.COURSE
+        if course_id is None or exam_id is None:
+            return cls()
+        return cls.query.filter_by(user_id=user.id, course_id=course_id, exam_id=exam_id).first() or cls()
+
+    @classmethod
+    def _add_answer(cls, user_id, course_id, exam_id, correct):
+        return cls.query.filter_by(user_id=user_id, course_id=course_id, exam_id=exam_id).update({
+            cls.combo: cls.combo + 1 if correct else 0
+        }, synchronize_session=False)
+
+    @classmethod
+    def record(cls, user, course_id, exam_id, correct):
+        """Adds an answer to the course and exam combos, must be committed with the Stats row"""
+        for summary_exam_id in (cls.COURSE, exam_id):
+            # A missing summary already has a combo of 0
+            if cls._add_answer(user.id, course_id, summary_exam_id, correct) or not correct:
+                continue
+            try:
+                # Only the insert is undone if it conflicts, not the answer
+                with db.session.begin_nested():
+                    db.session.execute(cls.__table__.insert().values(
+                        user_id=user.id, course_id=course_id, exam_id=summary_exam_id, combo=1
+                    ))
+            except IntegrityError:
+                # Created by another first answer since the update
+                cls._add_answer(user.id, course_id, summary_exam_id, correct)
+
+    @classmethod
+    def rebuild(cls, user):
+        """Recounts all of the user's combos from the stats log"""
+        from memorizer.stats import summarize, summary_mappings
+        cls.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+        db.session.bulk_insert_mappings(cls, summary_mappings(summarize(user.id)))
+
+    @classmethod
+    def reset_course(cls, user, course):
+        cls.query.filter_by(user_id=user.id, course_id=course.id).update({cls.combo: 0}, synchronize_session=False)
+
+    @classmethod
+    def reset_exam(cls, user, exam):
+        """Zeroes the exam combo and recounts the course combo from the remaining stats"""
+        cls.query.filter_by(user_id=user.id, course_id=exam.course_id, exam_id=exam.id)\
+            .update({cls.combo: 0}, synchronize_session=False)
+        stats = Stats.course(user, exam.course.code)
+        last_wrong = stats.filter(Stats.correct.is_(False)).with_entities(db.func.max(Stats.id)).scalar()
+        cls.query.filter_by(user_id=user.id, course_id=exam.course_id, exam_id=cls.COURSE).update({
+            cls.combo: stats.filter(Stats.id > (last_wrong or 0)).count()
+        }, synchronize_session=False)
+
 
 orm.configure_mappers()
@@ -0,0 +1,129 @@
+"""
+    Static JSON snapshots of the question lists, for everyone but admins.
+
+    The list of a course or exam is serialized once per content version and
+    written, along with a gzipped copy, to a file named after the hash of its
+    content in SNAPSHOT_DIR. The API redirects to the file, which never changes
+    and so can be cached by browsers for a long time, and can be sent by the
+    web server when USE_X_SENDFILE is set
+"""
+import gzip
+import hashlib
+import io
+import os
+import re
+import tempfile
+
+from flask import abort, current_app, g, request, send_file
+from flask_script import Command, Manager
+
+from memorizer import catalogue, models
+from memorizer.cache import cache, content_version
+from memorizer.config import CACHE_TIME
+
+DIGEST = re.compile(r'^[0-9a-f]{40}$')
+MAX_AGE = 60 * 60 * 24 * 365  # a year, the content of a file never changes
+
+
+def enabled():
+    return current_app.config.get('QUESTION_SNAPSHOTS', False)
+
+
+def snapshot_dir():
+    return current_app.config['SNAPSHOT_DIR']
+
+
+def _path(digest, gzipped=False):
+    return os.path.join(snapshot_dir(), digest + ('.json.gz' if gzipped else '.json'))
+
+
+def _write(path, data):
+    """Writes a file all at once, so it is never sent half written"""
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as file:
+        file.write(data)
+    os.chmod(temporary, 0o644)
+    os.replace(temporary, path)
+
+
+def _gzip(body):
+    # No timestamp, so the same content always gives the same file
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as file:
+        file.write(body)
+    return buffer.getvalue()
+
+
+def publish(body):
+    """Saves a JSON body and its gzipped copy unless they exist, returns the digest naming them"""
+    digest = hashlib.sha1(body).hexdigest()
+    os.makedirs(snapshot_dir(), exist_ok=True)
+    if not os.path.exists(_path(digest, gzipped=True)):
+        _write(_path(digest), body)
+        _write(_path(digest, gzipped=True), _gzip(body))
+    return digest
+
+
+def snapshot(name, course_code, exam_name, build):
+    """
+        Digest of the current snapshot of a question list, published from
+        build() when content in the course or exam has changed
+    """
+    key = 'snapshot/{}/{}/{}'.format(name, course_code, exam_name or '')
+    version = content_version(course_code, exam_name)
+    cached = cache.get(key)
+    # Files may have been removed by a rebuild
+    if cached is not None and cached[0] == version and os.path.exists(_path(cached[1], gzipped=True)):
+        return cached[1]
+    digest = publish(build())
+    cache.set(key, (version, digest), timeout=CACHE_TIME)
+    return digest
+
+
+def send_snapshot(digest):
+    if not DIGEST.match(digest):
+        abort(404)
+    gzipped = 'gzip' in request.accept_encodings
+    path = _path(digest, gzipped)
+    if not os.path.exists(path):
+        abort(404)
+    response = send_file(path, mimetype='application/json', conditional=True, cache_timeout=MAX_AGE)
+    if gzipped:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.cache_control.public = True
+    return response
+
+
+def rebuild():
+    """Publishes the question lists of every course and exam and removes other snapshots, returns both counts"""
+    from memorizer.views.api import CourseQuestions, ExamQuestions
+    # Snapshots are what users who aren't admins see
+    g.user = models.User()
+    digests = set()
+    lists = catalogue.catalogue()
+    for code in lists.courses:
+        digests.add(CourseQuestions().snapshot(course=code))
+    for code, exam_name in lists.exams:
+        digests.add(ExamQuestions().snapshot(course=code, exam=exam_name))
+    removed = 0
+    for filename in os.listdir(snapshot_dir()) if os.path.isdir(snapshot_dir()) else ():
+        digest = filename.split('.')[0]
+        # Files being written have temporary names
+        if DIGEST.match(digest) and digest not in digests:
+            os.remove(os.path.join(snapshot_dir(), filename))
+            removed += 1
+    return len(digests), removed
+
+
+class RebuildCommand(Command):
+    'Publish snapshots of every question list and remove old ones'
+
+    def run(self):
+        with current_app.test_request_context():
+            published, removed = rebuild()
+        print('Published {} snapshots, removed {} old files'.format(published, removed))
+
+
+SnapshotCommand = Manager(usage='Maintain static question list snapshots')
+SnapshotCommand.add_command('rebuild', RebuildCommand)
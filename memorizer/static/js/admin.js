@@ -184,6 +184,92 @@
         });
     };
 
+    // Version history, loaded a page at a time when it is first opened
+    var History = function(element) {
+        this.element = element;
+        this.url = element.dataset.url;
+        this.page = 0;
+        this.more = null;
+        var toggle = document.querySelector('[data-target="#' + element.id + '"]');
+        var load = function() {
+            toggle.removeEventListener('click', load, false);
+            this.load();
+        }.bind(this);
+        toggle.addEventListener('click', load, false);
+    };
+
+    History.prototype.load = function() {
+        Ajax({url: this.url, data: {page: this.page + 1}}, {
+            success: function(data) {
+                this.page = data.page;
+                if(this.more !== null) {
+                    this.element.removeChild(this.more);
+                    this.more = null;
+                }
+                for (var i = 0; i < data.versions.length; i++) {
+                    this.element.appendChild(this.li(data.versions[i]));
+                }
+                if(data.page < data.pages) {
+                    this.more = this.moreLi();
+                    this.element.appendChild(this.more);
+                }
+            }.bind(this),
+            error: function(data) {
+                Alert('could not load history', 'error');
+            }
+        });
+    };
+    History.prototype.li = function(version) {
+        var li = document.createElement('li');
+        var id = 'version-' + version.transaction_id;
+
+        var a = document.createElement('a');
+        a.href = '#';
+        a.className = 'collapse';
+        a.dataset.target = '#' + id;
+        a.textContent = version.issued_at + ' #' + version.number + (version.user ? ' av ' + version.user : '');
+        Collapse.add(a);
+        li.appendChild(a);
+
+        var div = document.createElement('div');
+        div.id = id;
+        div.className = 'collapsed';
+        var table = document.createElement('table');
+        var thead = table.createTHead().insertRow();
+        ['field', 'before', 'after'].forEach(function(heading) {
+            var th = document.createElement('th');
+            th.textContent = heading;
+            thead.appendChild(th);
+        });
+        var tbody = table.createTBody();
+        version.changes.forEach(function(change) {
+            var row = tbody.insertRow();
+            change.forEach(function(value) {
+                row.insertCell().textContent = value === null ? '' : value;
+            });
+        });
+        div.appendChild(table);
+        li.appendChild(div);
+        return li;
+    };
+    History.prototype.moreLi = function() {
+        var li = document.createElement('li');
+        var a = document.createElement('a');
+        a.href = '#';
+        a.textContent = 'older versions';
+        a.onclick = function(e) {
+            e.preventDefault();
+            this.load();
+        }.bind(this);
+        li.appendChild(a);
+        return li;
+    };
+
+    var histories = document.getElementsByClassName('history');
+    for (var h = 0; histories[h]; h++) {
+        new History(histories[h]);
+    }
+
     // Initialize admin forms
     var forms = document.getElementsByClassName('form-admin');
     var object = document.getElementsByClassName('admin-list')[0];
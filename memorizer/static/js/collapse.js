@@ -40,13 +40,19 @@ var Collapse = (function() {
         }, 400);
     };
 
+    var add = function(element) {
+        element.addEventListener('click', toggle, false);
+    };
+
     return {
         init: function() {
             var collapses = document.querySelectorAll('.collapse');
             for (var i = collapses.length - 1; i >= 0; i--) {
-                collapses[i].addEventListener('click', toggle, false);
+                add(collapses[i]);
             }
-        }
+        },
+        // For elements added after the page has loaded
+        add: add
     };
 })();
 
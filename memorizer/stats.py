@@ -0,0 +1,61 @@
+from flask_script import Command, Manager
+
+from memorizer import models
+from memorizer.database import db
+
+
+def summarize(user_id=None):
+    """Recounts the course and exam combos of every user (or a single user) from the raw stats log"""
+    combos = {}
+    stats = db.session.query(models.Stats.user_id, models.Exam.course_id, models.Exam.id, models.Stats.correct)\
+        .join(models.Question, models.Question.id == models.Stats.question_id)\
+        .join(models.Exam, models.Exam.id == models.Question.exam_id)\
+        .filter(models.Stats.reset.is_(False))\
+        .order_by(models.Stats.id)
+    if user_id is not None:
+        stats = stats.filter(models.Stats.user_id == user_id)
+    for user_id, course_id, exam_id, correct in stats.yield_per(1000):
+        for key in ((user_id, course_id, models.StatsSummary.COURSE), (user_id, course_id, exam_id)):
+            combos[key] = combos.get(key, 0) + 1 if correct else 0
+    return combos
+
+
+def summary_mappings(combos):
+    # Missing summaries have a combo of 0
+    return [
+        {'user_id': user_id, 'course_id': course_id, 'exam_id': exam_id, 'combo': combo}
+        for (user_id, course_id, exam_id), combo in combos.items() if combo
+    ]
+
+
+class BackfillCommand(Command):
+    'Rebuild stats aggregates from the stats log'
+
+    def run(self):
+        mappings = summary_mappings(summarize())
+        models.StatsSummary.query.delete()
+        db.session.bulk_insert_mappings(models.StatsSummary, mappings)
+        db.session.commit()
+        print('Rebuilt', len(mappings), 'stats aggregates')
+
+
+class CheckCommand(Command):
+    'Compare stats aggregates with the stats log'
+
+    def run(self):
+        expected = summarize()
+        actual = {(row.user_id, row.course_id, row.exam_id): row.combo for row in models.StatsSummary.query}
+        mismatches = 0
+        for key in expected.keys() | actual.keys():
+            if expected.get(key, 0) != actual.get(key, 0):
+                mismatches += 1
+                print('user {} course {} exam {}: expected combo {} found {}'.format(
+                    *key, expected.get(key, 0), actual.get(key, 0)
+                ))
+        print('Found', mismatches, 'inconsistent stats aggregates')
+        return 1 if mismatches else 0
+
+
+StatsCommand = Manager(usage='Maintain stats aggregates')
+StatsCommand.add_command('backfill', BackfillCommand)
+StatsCommand.add_command('check', CheckCommand)
@@ -4,7 +4,10 @@ from flask import g, redirect, request, session, url_for
 
 
 def user_setup():
-    """Set up user info for first time visitors"""
+    """
+        Set up user info. First time visitors get an anonymous user
+        which is not saved until persist_user is called
+    """
     from memorizer import models
 
     if 'user' in session:
@@ -12,13 +15,20 @@ def user_setup():
         user = models.User.query.get(session['user'])
         if user:
             return user
-    user = models.User()
+    return models.User()
+
+
+def persist_user(user):
+    """Saves an anonymous user with the current transaction, needed before storing anything about the user"""
+    from memorizer import models
+
+    if user.id is not None:
+        return
     models.db.session.add(user)
-    models.db.session.commit()
+    models.db.session.flush()
     session['user'] = user.id
     # Set session to permament
     session.permanent = True
-    return user
 
 
 def get_user():
@@ -1,89 +1,139 @@
 import random
 import re
+from array import array
+from collections import namedtuple
 
-from memorizer import models
-from memorizer.cache import cache
+from sqlalchemy import false
+
+from memorizer import catalogue, models
+from memorizer.answerlog import answer_log
+from memorizer.bitmaps import add_answer, answer_bits, popcount, random_unset
+from memorizer.cache import cache, content_version, memoize_scoped
 from memorizer.config import CACHE_TIME
 from memorizer.user import get_user
 
 
-@cache.memoize(CACHE_TIME)
 def max_questions_exam(course_code, exam_name):
-    return models.Question.query.\
-        join(models.Exam).join(models.Course).\
-        filter_by(code=course_code).\
-        filter(models.Exam.name == exam_name).count()
+    return len(all_questions(course_code, exam_name))
 
 
-@cache.memoize(CACHE_TIME)
 def max_questions_course(course_code):
-    course = models.Course.query.filter_by(code=course_code).first()
-    if course:
-        return course.question_count
-    else:
-        return 0
+    return len(all_questions(course_code, None))
 
 
 def generate_stats(course_code, exam_name=None):
     stats_data = {}
     if not exam_name:
         stats_data['max'] = max_questions_course(course_code)
-        stats = models.Stats.course(get_user(), course_code)
     else:
         stats_data['max'] = max_questions_exam(course_code, exam_name)
-        stats = models.Stats.exam(get_user(), course_code, exam_name)
-    stats_all = stats.all()
-    stats_data['total'] = len(stats_all)
-    stats_data['points'] = len(list(filter(lambda stat: stat.correct, stats_all)))
+    user = get_user()
+    bits = answer_bits(user, course_code, exam_name)
+    combo = models.StatsSummary.find(user, course_code, exam_name).combo
+    # Answers waiting to be saved in write-behind mode
+    questions = all_questions(course_code, exam_name)
+    for answer in answer_log.pending(user, course_code, exam_name):
+        bits = add_answer(bits, questions, answer['question_id'], answer['correct'])
+        combo = combo + 1 if answer['correct'] else 0
+    stats_data['total'] = popcount(bits.answered)
+    stats_data['points'] = popcount(bits.correct)
     stats_data['grade'] = grade(stats_data['points'], stats_data['total'])
     stats_data['percentage'] = percentage(stats_data['points'], stats_data['total'])
-
-    combo = 0
-    for stat in reversed(stats_all):
-        if stat.correct:
-            combo += 1
-        else:
-            break
     stats_data['combo'] = combo
     return stats_data
 
 
-@cache.memoize(CACHE_TIME)
+@memoize_scoped(CACHE_TIME)
 def all_questions(course_code, exam_name):
-    course_m = models.Course.query.filter_by(code=course_code).one_or_none()
+    """
+        Ordinal index for a course or exam: question ids ordered by position,
+        so question number n is all_questions(...)[n - 1].
+        Stored as an array since it is (un)pickled on every cache hit
+    """
+    questions = scope_questions(course_code, exam_name).with_entities(models.Question.id).order_by(models.Question.id)
+    return array('I', (question_id for question_id, in questions))
+
+
+def scope_questions(course_code, exam_name):
+    """Questions in an exam, or in a course without its hidden exams"""
     if exam_name:
-        exam_m = models.Exam.query.filter_by(course=course_m, name=exam_name).one_or_none()
-        questions = models.Question.query.filter_by(exam=exam_m)
-    else:
-        questions = models.Question.query\
-            .filter_by(course=course_m)\
-            .join(models.Exam)\
-            .filter(models.Exam.hidden.is_(False))
-    return questions.with_entities(models.Question.id).order_by('id').all()
+        exam_id = catalogue.exam_id(course_code, exam_name)
+        if exam_id is None:
+            return models.Question.query.filter(false())
+        return models.Question.query.filter_by(exam_id=exam_id)
+    # Joined rather than filtered by the course proxy, which scans every question
+    return models.Question.query\
+        .join(models.Exam)\
+        .join(models.Course)\
+        .filter(models.Course.code == course_code, models.Exam.hidden.is_(False))
+
+
+class AnswerKey(namedtuple('AnswerKey', (
+    'exam_id course_id course_code exam_name multiple multiple_correct correct alternatives'
+))):
+    """Everything needed to grade and record an answer, so answering does not load the question"""
+    def grade(self, answer):
+        """Grades a yes/no answer or a set of alternative ids"""
+        if not self.multiple:
+            return self.correct == answer
+        # Checking if all alternatives are correct
+        if self.multiple_correct:
+            return self.alternatives == answer
+        return self.alternatives >= answer
+
+
+@cache.memoize(CACHE_TIME)
+def _answer_key(version, question_id):
+    question = models.Question.query.filter_by(id=question_id)
+    question = question.join(models.Exam).join(models.Course).with_entities(
+        models.Question.type, models.Question.correct, models.Question.exam_id, models.Exam.course_id,
+        models.Course.code, models.Exam.name, models.Exam.multiple_correct
+    ).first()
+    if question is None:
+        return None
+    question_type, correct, exam_id, course_id, course_code, exam_name, multiple_correct = question
+    alternatives = models.Alternative.query.filter_by(question_id=question_id, correct=True)\
+        .with_entities(models.Alternative.id).order_by(None)
+    return AnswerKey(
+        exam_id, course_id, course_code, exam_name,
+        question_type == models.Question.MULTIPLE, multiple_correct, correct,
+        frozenset(alternative_id for alternative_id, in alternatives)
+    )
+
+
+def answer_key(question_id):
+    """The cached answer key of a question, or None if it does not exist"""
+    # Questions are looked up by id alone, so any content change makes the keys stale
+    return _answer_key(content_version(), question_id)
+
+
+def question_at(course_code, exam_name, number):
+    """Query for question number n (starting at 1) using the ordinal index"""
+    questions = all_questions(course_code, exam_name)
+    if 0 < number <= len(questions):
+        return models.Question.query.filter_by(id=questions[number - 1])
+    return models.Question.query.filter(false())
 
 
 def random_id(id=None, course=None, exam=None):
     """
-        Returns a random id from questions that have not been answered.
+        Returns a random number of a question that has not been answered,
+        picked from the user's answered questions bitset.
         Returns a random number if none available
     """
     # All questions
     questions = all_questions(course, exam)
-    # Already answered questions
-    if exam:
-        query = models.Stats.exam(get_user(), course, exam)
-    else:
-        query = models.Stats.course(get_user(), course)
-    answered = set(query.with_entities(models.Stats.question_id).all())
-    # List of indexes for unanswered questions
-    indexes = [i + 1 for i, question in enumerate(questions) if (i + 1) != id and question not in answered]
+    user = get_user()
+    bits = answer_bits(user, course, exam)
+    for answer in answer_log.pending(user, course, exam):
+        bits = add_answer(bits, questions, answer['question_id'], answer['correct'])
     # Ignore current question
-    if indexes:
-        # Select random index
-        return random.choice(indexes)
-    else:
+    current = id - 1 if id is not None and 0 < id <= len(questions) else None
+    index = random_unset(bits.answered, len(questions), skip=current)
+    if index is None:
         # All questions have been answered
         return random.randint(1, len(questions) + 1)
+    return index + 1
 
 
 def sort_exam(exam):
@@ -1,10 +1,12 @@
+import io
 import json
 
 from flask import Blueprint, flash, render_template, request
 
-from memorizer import importer, models
+from memorizer import importer, jsonstream, models
 from memorizer.forms import AlternativeForm, CourseForm, ExamForm, QuestionForm
-from memorizer.user import login_required
+from memorizer.metrics import sql_metrics
+from memorizer.user import admin_required, login_required
 
 admin = Blueprint('admin', __name__)
 
@@ -23,8 +25,8 @@ def courses():
         exam_json = request.form.get('json')
         if exam_json:
             try:
-                questions = json.loads(exam_json)
-                importer.import_exam(questions)
+                fields = jsonstream.iter_fields(io.StringIO(exam_json), 'questions')
+                importer.import_exam_stream(fields)
                 flash('all questions were imported', 'success')
             except json.decoder.JSONDecodeError:
                 flash('void JSON', 'error')
@@ -67,7 +69,7 @@ def exam(course_id, exam_id):
 def question(question_id):
     question = question = models.Question.query.filter_by(id=question_id).first_or_404()
     query = models.Question.query.filter_by(exam=question.exam)
-    prev_question = query.filter(models.Question.id < question_id).order_by('-id').first()
+    prev_question = query.filter(models.Question.id < question_id).order_by(models.Question.id.desc()).first()
     next_question = query.filter(models.Question.id > question_id).first()
     form = QuestionForm(obj=question)
     alt = models.Alternative(question_id=question.id)
@@ -87,3 +89,13 @@ def alternative(question_id, alternative_id):
     form = AlternativeForm(obj=alternative)
     context = dict(form=form, question=question, alternative=alternative)
     return render_template('admin/alternative.html', **context)
+
+
+@admin.route('/metrics', methods=['GET', 'POST'])
+@admin_required
+def metrics():
+    if request.method == 'POST':
+        sql_metrics.reset()
+        flash('metrics were reset', 'success')
+    context = dict(endpoints=sql_metrics.summary(), threshold=sql_metrics.threshold)
+    return render_template('admin/metrics.html', **context)
@@ -1,12 +1,15 @@
+import hashlib
 import json
+from urllib.parse import urlencode
 
-from flask import Blueprint, Response, request
+from flask import Blueprint, Response, abort, redirect, request, url_for
 from flask.views import MethodView
 
-from memorizer import forms, models, utils
-from memorizer.cache import cache
+from memorizer import catalogue, forms, history, models, snapshots, utils
+from memorizer.answerlog import answer_log
+from memorizer.cache import cache, content_version
 from memorizer.config import CACHE_TIME
-from memorizer.user import get_user
+from memorizer.user import get_user, persist_user
 
 api = Blueprint('api', __name__)
 
@@ -15,12 +18,6 @@ def error(message):
     return {'message': message}
 
 
-class CacheView(object):
-    def __repr__(self):
-        """Hack to make memoization work with self and different get parameters"""
-        return '%s (%s)' % (self.__class__.__name__, request.args)
-
-
 class JsonView(MethodView):
     def dispatch_request(self, *args, **kwargs):
         """Returns a json document with mimetype set"""
@@ -30,13 +27,47 @@ class JsonView(MethodView):
         )
 
 
+class CachedJsonView(JsonView):
+    """
+        Caches the encoded GET responses per url, query string and user role
+        until content in the view's course/exam scope changes
+    """
+
+    def cache_scope(self, **kwargs):
+        """Course code and exam name the response depends on, None for everything"""
+        return None, None
+
+    def cache_key(self, **kwargs):
+        role = 'admin' if get_user().admin else 'user'
+        return 'response/{}/{}/{}/{}/{}'.format(
+            request.endpoint,
+            urlencode(sorted(request.view_args.items())),
+            urlencode(sorted(request.args.items(multi=True))),
+            role,
+            content_version(*self.cache_scope(**kwargs))
+        )
+
+    def dispatch_request(self, *args, **kwargs):
+        if request.method != 'GET':
+            return super().dispatch_request(*args, **kwargs)
+        key = self.cache_key(**kwargs)
+        cached = cache.get(key)
+        if cached is None:
+            body = super().dispatch_request(*args, **kwargs).get_data()
+            cached = (body, hashlib.sha1(body).hexdigest())
+            cache.set(key, cached, timeout=CACHE_TIME)
+        body, etag = cached
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        return response.make_conditional(request)
+
+
 # REST API
 
-class APIView(JsonView, CacheView):
+class APIView(CachedJsonView):
     model = None
     form = None
 
-    @cache.memoize(CACHE_TIME)
     def get(self, object_id=None):
         # Get a single object
         if object_id:
@@ -77,8 +108,6 @@ class APIView(JsonView, CacheView):
             form.populate_obj(object)
             models.db.session.add(object)
             models.db.session.commit()
-            # Deleting cache
-            cache.clear()
         else:
             response['errors'] = form.errors
         return response
@@ -99,8 +128,6 @@ class APIView(JsonView, CacheView):
         if response['success']:
             models.db.session.add(object)
             models.db.session.commit()
-            # Deleting cache
-            cache.clear()
         else:
             response['errors'] = form.errors
         return response
@@ -115,8 +142,6 @@ class APIView(JsonView, CacheView):
         if object:
             models.db.session.delete(object)
             models.db.session.commit()
-            # Deleting cache
-            cache.clear()
         return {'success': bool(object)}
 
 
@@ -157,26 +182,43 @@ register_api(AlternativeAPI, 'alterative_api', '/alternatives/')
 
 # Helper apis
 
-class CourseQuestions(JsonView, CacheView):
-    @cache.memoize(CACHE_TIME)
+class SnapshotJsonView(CachedJsonView):
+    """Redirects users who aren't admins to a static snapshot of the response when QUESTION_SNAPSHOTS is set"""
+
+    def snapshot(self, **kwargs):
+        """Digest of the current snapshot, published if content has changed"""
+        return snapshots.snapshot(
+            type(self).__name__, *self.cache_scope(**kwargs), lambda: json.dumps(self.get(**kwargs)).encode()
+        )
+
+    def dispatch_request(self, *args, **kwargs):
+        if request.method == 'GET' and snapshots.enabled() and not get_user().admin:
+            return redirect(url_for('api.snapshot', digest=self.snapshot(**kwargs)))
+        return super().dispatch_request(*args, **kwargs)
+
+
+class CourseQuestions(SnapshotJsonView):
+    def cache_scope(self, course):
+        return course, None
+
     def get(self, course):
-        course_m = models.Course.query.filter_by(code=course).first_or_404()
-        questions = models.Question.query.filter_by(course=course_m).all()
-        serialized_objects = [question_m.serialize() for question_m in questions]
-        return [obj for obj in serialized_objects if obj is not None]
+        catalogue.course_or_404(course)
+        exam_ids = catalogue.course_exam_ids(course)
+        return models.Question.serialize_all(models.Question.query.filter(models.Question.exam_id.in_(exam_ids)))
 
 
-class ExamQuestions(JsonView, CacheView):
-    @cache.memoize(CACHE_TIME)
+class ExamQuestions(SnapshotJsonView):
+    def cache_scope(self, course, exam):
+        return course, exam
+
     def get(self, course, exam):
-        course_m = models.Course.query.filter_by(code=course).first_or_404()
-        exam_m = models.Exam.query.filter_by(course=course_m, name=exam).first_or_404()
-        serialized_objects = [question_m.serialize() for question_m in exam_m.questions]
-        return [obj for obj in serialized_objects if obj is not None]
+        exam_m = catalogue.exam_or_404(course, exam)
+        return models.Question.serialize_all(models.Question.query.filter_by(exam=exam_m))
 
 
 api.add_url_rule('/questions/<string:course>/all/', view_func=CourseQuestions.as_view('course_questions'))
 api.add_url_rule('/questions/<string:course>/<string:exam>/', view_func=ExamQuestions.as_view('exam_questions'))
+api.add_url_rule('/snapshots/<string:digest>.json', 'snapshot', snapshots.send_snapshot)
 
 
 class Stats(JsonView):
@@ -188,9 +230,17 @@ api.add_url_rule('/stats/<string:course_code>/<string:exam_name>/', view_func=St
 api.add_url_rule('/stats/<string:course_code>/', view_func=Stats.as_view('stats_course'))
 
 
-def correct_alternatives(question):
-    alts = models.Alternative.query.filter_by(question=question, correct=True)
-    return {alt.id for alt in alts}
+class History(JsonView):
+    def get(self, model, object_id):
+        if not get_user().registered:
+            return {'errors': [error('Not logged in')]}
+        if model not in history.VERSIONED:
+            abort(404)
+        page = max(request.args.get('page', 1, type=int), 1)
+        return history.history_page(history.VERSIONED[model], object_id, page)
+
+
+api.add_url_rule('/history/<string:model>/<int:object_id>/', view_func=History.as_view('history'))
 
 
 class Answer(JsonView):
@@ -199,29 +249,22 @@ class Answer(JsonView):
             question_id = int(request.form.get('question'))
         except ValueError:
             return error('Missing question')
-        question = models.Question.query.get_or_404(question_id)
-        if question.multiple:
+        key = utils.answer_key(question_id)
+        if key is None:
+            abort(404)
+        if key.multiple:
             try:
-                answer_alt = set(map(int, request.form.getlist('alternative')))
+                answer = set(map(int, request.form.getlist('alternative')))
             except ValueError:
                 return error('Missing alternative')
-            correct_alt = correct_alternatives(question)
-            # Checking if all alternatives are correct
-            if question.exam.multiple_correct:
-                correct = correct_alt == answer_alt
-            else:
-                correct = correct_alt >= answer_alt
         else:
             # Yes/No
             answer = request.form.get('correct', False) == 'true'
-            correct = question.correct == answer
+        correct = key.grade(answer)
         user = get_user()
-        answered = models.Stats.answered(user, question)
-        if not answered:
-            stat = models.Stats(user, question, correct)
-            models.db.session.add(stat)
-            models.db.session.commit()
-        return {'success': not answered, 'correct': correct}
+        persist_user(user)
+        saved = answer_log.save(user, question_id, key, correct)
+        return {'success': saved, 'correct': correct}
 
 
 api.add_url_rule('/answer', view_func=Answer.as_view('answer'), methods=['POST'])
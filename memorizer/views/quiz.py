@@ -2,8 +2,10 @@ import random
 
 from flask import Blueprint, abort, flash, redirect, render_template, request, session, url_for
 
-from memorizer import forms, models, utils
-from memorizer.user import get_user
+from memorizer import catalogue, forms, models, utils
+from memorizer.answerlog import answer_log
+from memorizer.bitmaps import forget_answers
+from memorizer.user import get_user, persist_user
 from memorizer.views import TemplateMethodView
 
 quiz = Blueprint('quiz', __name__)
@@ -48,7 +50,7 @@ class Register(TemplateMethodView):
         user.username = form.username.data
         user.password = form.password.data
         user.registered = True
-        models.db.session.add(user)
+        persist_user(user)
         models.db.session.commit()
 
 
@@ -65,9 +67,15 @@ def login():
         form = forms.LoginForm(request.form)
         if form.validate():
             # Login
-            user = models.User.query.filter_by(username=form.username.data).first()
-            if user and user.password == form.password.data:
-                session['user'] = user.id
+            account = models.User.query.filter_by(username=form.username.data).first()
+            if account and account.password == form.password.data:
+                # Keeping questions answered before logging in
+                if user.id is not None:
+                    answer_log.flush()
+                    models.Stats.move(user, account)
+                    models.db.session.commit()
+                    forget_answers([user.id, account.id])
+                session['user'] = account.id
                 return redirect(url_for('quiz.main'))
     else:
         form = forms.LoginForm()
@@ -91,23 +99,33 @@ def tips():
 def reset_stats_course(course):
     """Reset stats for a course"""
     # Check if course exists
-    course = models.Course.query.filter_by(code=course).first_or_404()
-    stats_query = models.Stats.course(get_user(), course.code).with_entities(models.Stats.id).subquery()
+    course = catalogue.course_or_404(course)
+    user = get_user()
+    # Answers waiting to be saved have to be reset as well
+    answer_log.flush()
+    stats_query = models.Stats.course(user, course.code).with_entities(models.Stats.id).subquery()
     models.Stats.query.filter(models.Stats.id.in_(stats_query)).\
         update({models.Stats.reset: True}, synchronize_session=False)
+    models.StatsSummary.reset_course(user, course)
     models.db.session.commit()
+    forget_answers([user.id], course.code)
     return redirect(url_for('quiz.course', course=course.code))
 
 
 @quiz.route('/reset/<string:course>/<string:exam>/')
 def reset_stats_exam(course, exam):
     """Reset stats for a course"""
-    course = models.Course.query.filter_by(code=course).first_or_404()
-    exam = models.Exam.query.filter_by(course=course, name=exam).first_or_404()
-    stats_query = models.Stats.exam(get_user(), course.code, exam.name).with_entities(models.Stats.id).subquery()
+    course = catalogue.course_or_404(course)
+    exam = catalogue.exam_or_404(course.code, exam)
+    user = get_user()
+    # Answers waiting to be saved have to be reset as well
+    answer_log.flush()
+    stats_query = models.Stats.exam(user, course.code, exam.name).with_entities(models.Stats.id).subquery()
     models.Stats.query.filter(models.Stats.id.in_(stats_query)).\
         update({models.Stats.reset: True}, synchronize_session=False)
+    models.StatsSummary.reset_exam(user, exam)
     models.db.session.commit()
+    forget_answers([user.id], course.code)
     return redirect(url_for('quiz.exam', course=course.code, exam=exam.name))
 
 
@@ -115,7 +133,7 @@ def reset_stats_exam(course, exam):
 @quiz.route('/<string:course>/all/0')
 def course(course):
     """Redirects to a random question for a chosen course"""
-    models.Course.query.filter_by(code=course).first_or_404()
+    catalogue.course_or_404(course)
     return redirect(url_for(
         'quiz.question_course', course_code=course, id=utils.random_id(course=course))
     )
@@ -125,8 +143,7 @@ def course(course):
 @quiz.route('/<string:course>/<string:exam>/0')
 def exam(course, exam):
     """Redirects to the first question for a chosen exam"""
-    course_m = models.Course.query.filter_by(code=course).first_or_404()
-    exam_m = models.Exam.query.filter_by(course=course_m, name=exam).first_or_404()
+    exam_m = catalogue.exam_or_404(course, exam)
     return redirect(url_for('quiz.question_exam', course_code=course, exam_name=exam_m.name, id=1))
 
 
@@ -177,11 +194,8 @@ class QuestionMixin:
             else:
                 bool_answer = answer.lower() == 'true'
                 self.success = self.question.correct == bool_answer
-            user = get_user()
-            # Checking if question has already been answered
-            if not models.Stats.answered(user, self.question):
-                self.save_answer(user, self.success)
-            elif self.success:
+            # Answers to questions that have already been answered are not saved
+            if not self.save_answer(get_user(), self.success) and self.success:
                 flash('you have already answered this question so you will not get any points', 'info')
         else:
             flash('blank answer', 'error')
@@ -209,28 +223,23 @@ class QuestionMixin:
             answers = set(map(int, request.form.getlist('answer')))
         except ValueError:
             return False
-        correct_alternatives = models.Alternative.query.filter_by(question=self.question, correct=True)
-        correct_answers = {alt.id for alt in correct_alternatives}
-        if self.question.exam.multiple_correct:
-            return correct_answers == answers
-        else:
-            return answers <= correct_answers
+        return utils.answer_key(self.question.id).grade(answers)
 
     def save_answer(self, user, success):
-        stat = models.Stats(user, self.question, success)
-        models.db.session.add(stat)
-        models.db.session.commit()
+        """Saves the answer unless the question is already answered, returns if it was saved"""
+        persist_user(user)
+        return answer_log.save(user, self.question.id, utils.answer_key(self.question.id), success)
 
 
 class CourseQuestion(QuestionMixin, TemplateMethodView):
     def get(self, course_code, id, *args, **kwargs):
-        self.model = models.Course.query.filter_by(code=course_code).first_or_404()
+        self.model = catalogue.course_or_404(course_code)
         return super().get(id, course_code, *args, **kwargs)
 
     def context(self, *args, **kwargs):
         context = super().context(*args, **kwargs)
         reset_url = url_for('quiz.reset_stats_course', course=self.model.code)
-        random_question = utils.random_id(id=id, course=self.model.code)
+        random_question = utils.random_id(id=self.number, course=self.model.code)
 
         context.update({
             'exam_name': 'all',
@@ -248,13 +257,14 @@ quiz.add_url_rule(
 
 class ExamQuestion(QuestionMixin, TemplateMethodView):
     def get(self, course_code, exam_name, id, *args, **kwargs):
-        course = models.Course.query.filter_by(code=course_code).first_or_404()
-        self.model = models.Exam.query.filter_by(course=course, name=exam_name, hidden=False).first_or_404()
+        self.model = catalogue.exam_or_404(course_code, exam_name)
+        if self.model.hidden:
+            abort(404)
         return super().get(id, course_code, exam_name, *args, **kwargs)
 
     def context(self, *args, **kwargs):
         context = super().context(*args, **kwargs)
-        random_question = utils.random_id(id=id, course=self.model.course.code)
+        random_question = utils.random_id(id=self.number, course=self.model.course.code, exam=self.model.name)
         reset_url = url_for('quiz.reset_stats_exam', course=self.model.course.code, exam=self.model.name)
 
         context.update({
@@ -0,0 +1,32 @@
+"""one current answer per question
+
+Revision ID: 4e7a9c3b2d10
+Revises: 8b4d2a6c1f3e
+Create Date: 2026-10-18 19:41:07.512936
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4e7a9c3b2d10'
+down_revision = '8b4d2a6c1f3e'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    # Only the first answer to a question counts, later duplicates are marked as reset
+    stats = sa.table('stats', sa.column('id'), sa.column('user_id'), sa.column('question_id'), sa.column('reset'))
+    first = sa.select([sa.func.min(stats.c.id)])\
+        .where(stats.c.reset == sa.false())\
+        .group_by(stats.c.user_id, stats.c.question_id)
+    op.execute(stats.update()
+               .where(sa.and_(stats.c.reset == sa.false(), stats.c.id.notin_(first)))
+               .values(reset=sa.true()))
+    # Stats aggregates of users with duplicates are fixed with ./main.py stats backfill
+    op.create_index('ix_stats_user_id_question_id_current', 'stats', ['user_id', 'question_id'], unique=True,
+                    sqlite_where=sa.text('reset IS 0'), postgresql_where=sa.text('reset IS false'))
+
+
+def downgrade():
+    op.drop_index('ix_stats_user_id_question_id_current', table_name='stats')
@@ -1,12 +1,36 @@
 from flask_testing import TestCase
+from sqlalchemy import event
 
 from flask import g
 
 from memorizer.application import create_app
+from memorizer.cache import cache
 from memorizer.database import db
 from memorizer.models import User
 
 
+class QueryCounter:
+    """Records the SQL statements executed while active"""
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+        self.parameters = []
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self.record)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(self.engine, 'before_cursor_execute', self.record)
+
+    def __len__(self):
+        return len(self.statements)
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+        self.parameters.append(parameters)
+
+
 class MemorizerTestCase(TestCase):
     def create_app(self):
         return create_app('../tests/config.py')
@@ -15,6 +39,7 @@ class MemorizerTestCase(TestCase):
 class DatabaseTestCase(MemorizerTestCase):
     def setUp(self):
         super().setUp()
+        cache.clear()
         db.create_all()
 
     def tearDown(self):
@@ -22,6 +47,9 @@ class DatabaseTestCase(MemorizerTestCase):
         db.session.remove()
         db.drop_all()
 
+    def count_queries(self):
+        return QueryCounter(db.engine)
+
     def set_user(self, user):
         g.user = user
 
@@ -0,0 +1,150 @@
+import fcntl
+import json
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+from flask import url_for
+from sqlalchemy.exc import IntegrityError
+
+from memorizer import models, utils
+from memorizer.answerlog import answer_log
+from memorizer.database import db
+from tests import DatabaseTestCase
+from tests.models_mock import add_course, add_exam, add_question_boolean
+
+
+class WriteBehindTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.mock_user(save=True)
+        self.course = add_course()
+        self.exam = add_exam(self.course)
+        self.questions = [add_question_boolean(self.exam, text="Question") for _ in range(3)]
+        self.directory = tempfile.TemporaryDirectory()
+        self.journal = os.path.join(self.directory.name, 'answers.journal')
+        answer_log.open(self.journal)
+
+    def tearDown(self):
+        answer_log.close()
+        self.directory.cleanup()
+        super().tearDown()
+
+    def answer(self, question, correct=True):
+        response = self.client.post(url_for('api.answer'), data={
+            'question': question.id, 'correct': 'true' if correct else 'false'
+        })
+        return response.json['success']
+
+    def journal_lines(self):
+        with open(answer_log.journal_path) as journal:
+            return [json.loads(line) for line in journal]
+
+    def journal_answer(self, question):
+        return {
+            'user_id': self.user.id, 'question_id': question.id, 'correct': True,
+            'course_id': self.course.id, 'exam_id': self.exam.id,
+            'course_code': self.course.code, 'exam_name': self.exam.name,
+        }
+
+    def test_read_your_writes(self):
+        self.assertTrue(self.answer(self.questions[0]))
+        self.assertTrue(self.answer(self.questions[1], correct=False))
+        self.assertFalse(self.answer(self.questions[0]))
+
+        self.assertEqual(models.Stats.query.count(), 0)
+        self.assertEqual(len(self.journal_lines()), 2)
+        stats = utils.generate_stats(self.course.code, self.exam.name)
+        self.assertEqual((stats['total'], stats['points'], stats['combo']), (2, 1, 0))
+        for _ in range(10):
+            self.assertEqual(utils.random_id(course=self.course.code), 3)
+
+    def test_flush(self):
+        self.answer(self.questions[0])
+        self.answer(self.questions[1], correct=False)
+
+        self.assertEqual(answer_log.flush(), 2)
+
+        self.assertEqual(models.Stats.query.count(), 2)
+        self.assertEqual(self.journal_lines(), [])
+        stats = utils.generate_stats(self.course.code)
+        self.assertEqual((stats['total'], stats['points'], stats['combo']), (2, 1, 0))
+        self.assertFalse(self.answer(self.questions[0]))
+
+    def test_replay(self):
+        # Left by a stopped process
+        with open(self.journal + '.1', 'a') as journal:
+            journal.write(json.dumps(self.journal_answer(self.questions[0])) + '\n')
+            # Cut off by a crash
+            journal.write('{"user_id": ')
+
+        self.assertEqual(answer_log.replay(), 1)
+
+        self.assertEqual(models.Stats.query.one().question_id, self.questions[0].id)
+        self.assertEqual(self.journal_lines(), [])
+        self.assertFalse(os.path.exists(self.journal + '.1'))
+
+    def test_running_journal_not_replayed(self):
+        with open(self.journal + '.1', 'a') as journal:
+            # Held by the process writing it
+            fcntl.flock(journal.fileno(), fcntl.LOCK_EX)
+            journal.write(json.dumps(self.journal_answer(self.questions[0])) + '\n')
+            journal.flush()
+
+            self.assertEqual(answer_log.replay(), 0)
+
+        self.assertEqual(models.Stats.query.count(), 0)
+        self.assertTrue(os.path.exists(self.journal + '.1'))
+
+    def test_unsaveable_answer_dropped(self):
+        self.answer(self.questions[0])
+        self.answer(self.questions[1])
+        add_once = models.Stats.add_once
+
+        def deleted_question(user, question_id, correct):
+            if question_id == self.questions[0].id:
+                raise IntegrityError('INSERT', {}, Exception('foreign key constraint failed'))
+            return add_once(user, question_id, correct)
+        with patch.object(models.Stats, 'add_once', side_effect=deleted_question), \
+                patch.object(answer_log.app.logger, 'exception') as log:
+            self.assertEqual(answer_log.flush(), 1)
+
+        self.assertEqual(models.Stats.query.one().question_id, self.questions[1].id)
+        self.assertEqual(answer_log.pending(self.user), [])
+        self.assertEqual(self.journal_lines(), [])
+        log.assert_called_once()
+
+    def test_synced_once_per_interval(self):
+        with patch('memorizer.answerlog.os.fsync') as fsync:
+            for question in self.questions:
+                self.answer(question)
+            fsync.assert_not_called()
+            answer_log.sync()
+            answer_log.sync()
+        self.assertEqual(fsync.call_count, 1)
+
+    def test_close_removes_journal(self):
+        self.answer(self.questions[0])
+        journal_path = answer_log.journal_path
+        answer_log.close()
+        self.assertEqual(models.Stats.query.count(), 1)
+        self.assertFalse(os.path.exists(journal_path))
+
+    def test_reset(self):
+        self.answer(self.questions[0])
+        self.client.get(url_for('quiz.reset_stats_course', course=self.course.code))
+
+        self.assertTrue(models.Stats.query.one().reset)
+        self.assertEqual(utils.generate_stats(self.course.code)['total'], 0)
+
+    def test_background_flush(self):
+        answer_log.interval = 0.01
+        answer_log.start()
+        self.answer(self.questions[0])
+        for _ in range(100):
+            if not answer_log.pending(self.user):
+                break
+            time.sleep(0.01)
+        db.session.rollback()
+        self.assertEqual(models.Stats.query.count(), 1)
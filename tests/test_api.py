@@ -1,5 +1,16 @@
+import gzip
+import json
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
 from flask import url_for
 
+from memorizer import config, models, snapshots
+from memorizer.cache import bump_version, cache, content_version
+from memorizer.database import db
+from memorizer.utils import max_questions_course
 from tests import DatabaseTestCase
 from tests.models_mock import add_course, add_exam, add_question_boolean, add_question_multiple
 
@@ -67,7 +78,7 @@ class QuestionTest(DatabaseTestCase):
         self.assertFalse(response.json['correct'], 'Answer is incorrect')
 
     def test_correct_multiple_several_answers(self):
-        exam = add_exam(self.course, multiple_correct=True)
+        exam = add_exam(self.course, name="H17", multiple_correct=True)
         question = add_question_multiple(exam, text="Test Question", alternatives=[
             ('Alt 1', True),
             ('Alt 2', True),
@@ -83,7 +94,7 @@ class QuestionTest(DatabaseTestCase):
         self.assertTrue(response.json['correct'], 'Answer is incorrect')
 
     def test_correct_multiple_one_answer_several_correct(self):
-        exam = add_exam(self.course, multiple_correct=False)
+        exam = add_exam(self.course, name="H17", multiple_correct=False)
         question = add_question_multiple(exam, text="Test Question", alternatives=[
             ('Alt 1', True),
             ('Alt 2', True),
@@ -97,3 +108,395 @@ class QuestionTest(DatabaseTestCase):
 
         self.assert200(response)
         self.assertTrue(response.json['correct'], 'Answer is correct')
+
+
+class AnswerTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.mock_user(save=True)
+        self.course = add_course()
+        self.exam = add_exam(self.course)
+        self.question = add_question_multiple(self.exam, text="Test Question", alternatives=[
+            ('Alt 1', False),
+            ('Alt 2', True),
+        ])
+        self.correct = self.question.alternatives[1].id
+
+    def answer(self, alternative):
+        response = self.client.post(url_for('api.answer'), data={
+            'question': self.question.id, 'alternative': alternative
+        })
+        self.assert200(response)
+        return response.json
+
+    def test_answered_once(self):
+        self.assertEqual(self.answer(self.correct), {'success': True, 'correct': True})
+        self.assertEqual(self.answer(self.correct), {'success': False, 'correct': True})
+        self.assertEqual(models.Stats.query.count(), 1)
+        self.assertEqual(models.StatsSummary.find(self.user, self.course.code).combo, 1)
+
+    def test_cached_answer_key(self):
+        self.answer(self.correct)
+        models.Stats.query.update({models.Stats.reset: True})
+        db.session.commit()
+        db.session.refresh(self.user)
+        data = {'question': self.question.id, 'alternative': self.correct}
+        with self.count_queries() as queries:
+            self.client.post(url_for('api.answer'), data=data)
+        # Grading does not read anything, the answer and the course and exam totals are written
+        self.assertFalse([q for q in queries.statements if q.startswith('SELECT')])
+        self.assertEqual(len(queries), 3)
+
+    def test_answer_key_invalidated(self):
+        self.answer(self.correct)
+        self.question.alternatives[0].correct = True
+        self.question.alternatives[1].correct = False
+        db.session.commit()
+        models.Stats.query.delete()
+        db.session.commit()
+        self.assertTrue(self.answer(self.question.alternatives[0].id)['correct'])
+
+    def test_missing_question(self):
+        response = self.client.post(url_for('api.answer'), data={'question': self.question.id + 1})
+        self.assert404(response)
+
+
+class RandomQuestionTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.mock_user(save=True)
+        self.course = add_course()
+        self.exam = add_exam(self.course)
+        self.questions = [add_question_boolean(self.exam, text="Question") for _ in range(50)]
+
+    def answer(self, questions):
+        for question in questions:
+            db.session.add(models.Stats(self.user, question, True))
+        db.session.commit()
+
+    def random(self, current=-1):
+        response = self.client.get(url_for('api.random_question_course', course_code=self.course.code, id=current))
+        return response.json['index']
+
+    def test_unanswered(self):
+        self.answer(self.questions[:40])
+        numbers = {self.random(current=45) for _ in range(100)}
+        self.assertLessEqual(numbers, set(range(41, 51)) - {45})
+        self.assertGreater(len(numbers), 1)
+
+    def test_few_unanswered(self):
+        self.answer(self.questions[:47] + self.questions[48:49])
+        # Nearly every bit is set, so the unset ones are picked from directly
+        self.assertEqual({self.random(current=48) for _ in range(20)}, {50})
+        self.assertEqual({self.random() for _ in range(50)}, {48, 50})
+
+    def test_all_answered(self):
+        self.answer(self.questions)
+        self.assertIn(self.random(), range(1, 52))
+
+    def test_exam(self):
+        other = add_exam(self.course, name="V17")
+        add_question_boolean(other, text="Question")
+        self.answer(self.questions)
+        self.assertEqual(max_questions_course(self.course.code), 51)
+        self.assertEqual(self.client.get(url_for(
+            'api.random_question_course', course_code=self.course.code
+        )).json['index'], 51)
+        self.assertEqual(self.client.get(url_for(
+            'api.random_question_exam', course_code=self.course.code, exam_name=other.name
+        )).json['index'], 1)
+
+
+class QuestionListTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.mock_user(save=True)
+        self.course = add_course()
+        self.exam = add_exam(self.course)
+        self.hidden_exam = add_exam(self.course, name="H17")
+        self.hidden_exam.hidden = True
+        db.session.commit()
+        self.add_questions(self.exam, 2)
+        self.add_questions(self.hidden_exam, 1)
+
+    def add_questions(self, exam, count):
+        for n in range(count):
+            add_question_boolean(exam, text="Question", image="circle.png")
+            add_question_multiple(exam, text="Question", alternatives=[('Alt 1', False), ('Alt 2', True)])
+
+    def get(self, url):
+        cache.clear()
+        db.session.expire_all()
+        with self.count_queries() as queries:
+            response = self.client.get(url)
+        self.assert200(response)
+        return response, len(queries)
+
+    def assertQueriesConstant(self, url):
+        response, queries = self.get(url)
+        count = len(response.json)
+        self.add_questions(self.exam, 10)
+        response, queries_after = self.get(url)
+        self.assertEqual(len(response.json), count + 20)
+        self.assertEqual(queries_after, queries)
+
+    def test_course_questions(self):
+        url = url_for('api.course_questions', course=self.course.code)
+        response, queries = self.get(url)
+        self.assertEqual(len(response.json), 4)
+        self.assertEqual(len(response.json[1]['alternatives']), 2)
+        self.assertTrue(response.json[0]['image'].endswith('/img/TEST/circle.png'))
+        self.assertQueriesConstant(url)
+
+    def test_exam_questions(self):
+        self.assertQueriesConstant(url_for('api.exam_questions', course=self.course.code, exam=self.exam.name))
+
+
+class CacheInvalidationTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.mock_user(registered=True, save=True)
+        self.course1 = add_course(code="TEST1")
+        self.course2 = add_course(code="TEST2")
+        self.exam1 = add_exam(self.course1)
+        self.exam2 = add_exam(self.course2)
+        self.question1 = add_question_multiple(self.exam1, text="Question 1", alternatives=[('Alt', True)])
+        self.question2 = add_question_boolean(self.exam2, text="Question 2")
+
+    def get(self, course, exam=None):
+        if exam:
+            url = url_for('api.exam_questions', course=course.code, exam=exam.name)
+        else:
+            url = url_for('api.course_questions', course=course.code)
+        # Loading the user is not part of serving the response
+        db.session.refresh(self.user)
+        with self.count_queries() as queries:
+            response = self.client.get(url)
+        return response.json, len(queries)
+
+    def test_question_changed(self):
+        self.get(self.course1)
+        self.get(self.course2)
+        self.get(self.course2, self.exam2)
+
+        self.question1.text = "Changed"
+        db.session.commit()
+
+        questions, queries = self.get(self.course1)
+        self.assertEqual(questions[0]['text'], "Changed")
+        self.assertGreater(queries, 0)
+        self.assertEqual(self.get(self.course2)[1], 0)
+        self.assertEqual(self.get(self.course2, self.exam2)[1], 0)
+
+    def test_alternative_changed(self):
+        self.get(self.course1, self.exam1)
+        self.get(self.course2)
+
+        self.question1.alternatives[0].text = "Changed"
+        db.session.commit()
+
+        questions, queries = self.get(self.course1, self.exam1)
+        self.assertEqual(questions[0]['alternatives'][0]['text'], "Changed")
+        self.assertEqual(self.get(self.course2)[1], 0)
+
+    def test_exam_hidden(self):
+        self.assertEqual(max_questions_course(self.course1.code), 1)
+        self.exam1.hidden = True
+        db.session.commit()
+        self.assertEqual(max_questions_course(self.course1.code), 0)
+
+    def test_version_kept(self):
+        version = content_version(self.course1.code)
+        bump_version(self.course1.code)
+        # Long after the default cache timeout
+        with patch('flask_caching.backends.simplecache.time', return_value=time.time() + 3600):
+            self.assertEqual(content_version(self.course1.code), version + 1)
+
+    def test_course_api_edit(self):
+        self.get(self.course1)
+        self.get(self.course2)
+
+        response = self.client.put(
+            url_for('api.course_api', object_id=self.course2.id), data={'code': 'TEST3', 'name': 'Renamed'}
+        )
+
+        self.assertTrue(response.json['success'])
+        self.assertEqual(self.get(self.course1)[1], 0)
+        questions, queries = self.get(models.Course.query.get(self.course2.id))
+        self.assertEqual(len(questions), 1)
+        self.assertGreater(queries, 0)
+
+
+class ResponseCacheTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.mock_user(save=True)
+        self.course = add_course()
+        self.exam = add_exam(self.course)
+        self.hidden_exam = add_exam(self.course, name="H17")
+        self.hidden_exam.hidden = True
+        db.session.commit()
+        add_question_boolean(self.exam, text="Question 1")
+        add_question_boolean(self.hidden_exam, text="Question 2")
+
+    def get(self, url, **kwargs):
+        db.session.refresh(self.user)
+        with self.count_queries() as queries:
+            response = self.client.get(url, **kwargs)
+        return response, len(queries)
+
+    def test_etag(self):
+        url = url_for('api.course_questions', course=self.course.code)
+        response, queries = self.get(url)
+        self.assert200(response)
+        self.assertIsNotNone(response.headers.get('ETag'))
+
+        cached, queries = self.get(url)
+        self.assertEqual(cached.data, response.data)
+        self.assertEqual(queries, 0)
+
+        not_modified, queries = self.get(url, headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.data, b'')
+
+    def test_argument_order(self):
+        self.get(url_for('api.question_api') + '?exam_id={}&text=Question+1'.format(self.exam.id))
+        response, queries = self.get(url_for('api.question_api') + '?text=Question+1&exam_id={}'.format(self.exam.id))
+        self.assertEqual(len(response.json), 1)
+        self.assertEqual(queries, 0)
+
+    def test_hidden_for_role(self):
+        url = url_for('api.course_questions', course=self.course.code)
+        self.user.admin = True
+        db.session.commit()
+        response, queries = self.get(url)
+        self.assertEqual(len(response.json), 2)
+
+        self.user.admin = False
+        db.session.commit()
+        response, queries = self.get(url)
+        self.assertEqual(len(response.json), 1)
+
+
+class HistoryTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.mock_user(registered=True, save=True)
+        self.question = add_question_boolean(add_exam(add_course()), text="Question 0")
+        for n in range(1, 25):
+            self.question.text = "Question %d" % n
+            db.session.commit()
+
+    def get(self, page):
+        db.session.refresh(self.user)
+        url = url_for('api.history', model='questions', object_id=self.question.id, page=page)
+        with self.count_queries() as queries:
+            response = self.client.get(url)
+        return response.json, len(queries)
+
+    def test_pages(self):
+        history, queries = self.get(1)
+        self.assertEqual((history['page'], history['pages'], history['total']), (1, 2, 25))
+        self.assertEqual([version['number'] for version in history['versions']], list(range(25, 5, -1)))
+        self.assertEqual(history['versions'][0]['changes'], [['text', 'Question 23', 'Question 24']])
+        self.assertEqual(history['versions'][0]['user'], str(self.user))
+
+        history, queries_last = self.get(2)
+        self.assertEqual([version['number'] for version in history['versions']], list(range(5, 0, -1)))
+        changes = dict((field, (before, after)) for field, before, after in history['versions'][-1]['changes'])
+        self.assertEqual(changes['text'], (None, 'Question 0'))
+        # Versions, transactions and users are loaded together
+        self.assertEqual(queries, queries_last)
+        self.assertLessEqual(queries, 3)
+
+    def test_not_logged_in(self):
+        self.user.registered = False
+        db.session.commit()
+        history, queries = self.get(1)
+        self.assertIn('errors', history)
+
+    def test_unknown_model(self):
+        self.assert404(self.client.get(url_for('api.history', model='users', object_id=self.user.id)))
+
+    def test_admin_page(self):
+        response = self.client.get(url_for('admin.question', question_id=self.question.id))
+        self.assert200(response)
+        self.assertIn(url_for('api.history', model='questions', object_id=self.question.id).encode(), response.data)
+
+
+class SnapshotTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.app.config.update(QUESTION_SNAPSHOTS=True, SNAPSHOT_DIR=self.directory.name)
+        self.user = self.mock_user(save=True)
+        self.course = add_course()
+        self.exam = add_exam(self.course)
+        add_question_multiple(self.exam, "Question 1", [("Right", True), ("Wrong", False)])
+        add_question_boolean(self.exam, "Question 2")
+
+    def tearDown(self):
+        self.directory.cleanup()
+        super().tearDown()
+
+    def dynamic(self, url):
+        self.app.config['QUESTION_SNAPSHOTS'] = False
+        response = self.client.get(url)
+        self.app.config['QUESTION_SNAPSHOTS'] = True
+        return response.json
+
+    def test_redirect(self):
+        url = url_for('api.course_questions', course=self.course.code)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+        self.assertRegex(response.location, r'/api/snapshots/[0-9a-f]{40}\.json$')
+
+        snapshot = self.client.get(response.location)
+        self.assert200(snapshot)
+        self.assertEqual(snapshot.json, self.dynamic(url))
+        self.assertEqual(snapshot.cache_control.max_age, snapshots.MAX_AGE)
+        self.assertEqual(self.client.get(url).location, response.location)
+
+    def test_gzip(self):
+        url = url_for('api.exam_questions', course=self.course.code, exam=self.exam.name)
+        location = self.client.get(url).location
+        response = self.client.get(location, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        # No timestamp in the header
+        self.assertEqual(response.data[4:8], bytes(4))
+        self.assertEqual(json.loads(gzip.decompress(response.data).decode()), self.dynamic(url))
+
+    def test_content_changed(self):
+        url = url_for('api.course_questions', course=self.course.code)
+        location = self.client.get(url).location
+        add_question_boolean(self.exam, "Question 3")
+        changed = self.client.get(url).location
+        self.assertNotEqual(changed, location)
+        self.assertEqual(len(self.client.get(changed).json), 3)
+
+    def test_default_config(self):
+        self.app.config['QUESTION_SNAPSHOTS'] = config.QUESTION_SNAPSHOTS
+        response = self.client.get(url_for('api.course_questions', course=self.course.code))
+        self.assert200(response)
+        self.assertEqual(len(response.json), 2)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_admin(self):
+        self.user.admin = True
+        db.session.commit()
+        self.assert200(self.client.get(url_for('api.course_questions', course=self.course.code)))
+
+    def test_missing(self):
+        self.assert404(self.client.get(url_for('api.course_questions', course='MISSING')))
+        self.assert404(self.client.get(url_for('api.snapshot', digest='0' * 40)))
+        self.assert404(self.client.get('/api/snapshots/..%2Fconfig.json'))
+
+    def test_rebuild(self):
+        old = self.client.get(url_for('api.course_questions', course=self.course.code)).location
+        add_question_boolean(self.exam, "Question 3")
+        with self.app.test_request_context():
+            published, removed = snapshots.rebuild()
+        # The course has a single exam with the same questions, so they share a snapshot
+        self.assertEqual((published, removed), (1, 2))
+        self.assert404(self.client.get(old))
+        self.assertEqual(len(os.listdir(self.directory.name)), 2)
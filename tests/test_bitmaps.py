@@ -0,0 +1,89 @@
+from unittest import TestCase
+
+from flask import url_for
+
+from memorizer import bitmaps
+from memorizer.cache import cache
+from memorizer.database import db
+from memorizer.utils import generate_stats
+from tests import DatabaseTestCase
+from tests.models_mock import add_course, add_exam, add_question_boolean
+
+
+class RandomUnsetTest(TestCase):
+    def test_all_set(self):
+        self.assertIsNone(bitmaps.random_unset(0b1111, 4))
+        self.assertIsNone(bitmaps.random_unset(0, 0))
+
+    def test_one_unset(self):
+        bits = (1 << 1000) - 1 & ~(1 << 567)
+        self.assertEqual({bitmaps.random_unset(bits, 1000) for _ in range(20)}, {567})
+
+    def test_skip(self):
+        self.assertIsNone(bitmaps.random_unset(0b1011, 4, skip=2))
+        self.assertEqual({bitmaps.random_unset(0b0010, 4, skip=0) for _ in range(50)}, {2, 3})
+
+
+class AnswerBitsTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.mock_user(save=True)
+        self.course = add_course()
+        self.exam1 = add_exam(self.course, name="H16")
+        self.exam2 = add_exam(self.course, name="V17")
+        self.questions = [add_question_boolean(exam, text="Question") for exam in (self.exam1, self.exam2) * 2]
+
+    def answer(self, question, correct=True):
+        self.client.post(url_for('api.answer'), data={
+            'question': question.id, 'correct': 'true' if correct else 'false'
+        })
+
+    def bits(self, exam=None):
+        return bitmaps.answer_bits(self.user, self.course.code, exam.name if exam else None)
+
+    def test_answers(self):
+        self.answer(self.questions[0])
+        self.answer(self.questions[3], correct=False)
+
+        self.assertEqual(self.bits(), (0b1001, 0b0001))
+        self.assertEqual(self.bits(self.exam2), (0b10, 0b00))
+
+    def test_updated_in_cache(self):
+        self.bits()
+        self.bits(self.exam1)
+        self.answer(self.questions[2])
+
+        for obj in (self.user, self.course, self.exam1):
+            db.session.refresh(obj)
+        with self.count_queries() as queries:
+            self.assertEqual(self.bits(), (0b0100, 0b0100))
+            self.assertEqual(self.bits(self.exam1), (0b10, 0b10))
+        self.assertEqual(queries.statements, [])
+        cache.clear()
+        self.assertEqual(self.bits(), (0b0100, 0b0100))
+
+    def test_reset(self):
+        for question in self.questions:
+            self.answer(question)
+        self.client.get(url_for('quiz.reset_stats_exam', course=self.course.code, exam=self.exam1.name))
+
+        self.assertEqual(self.bits(), (0b1010, 0b1010))
+        self.assertEqual(self.bits(self.exam1), (0, 0))
+
+    def test_positions_moved(self):
+        self.answer(self.questions[2])
+        self.assertEqual(self.bits(), (0b100, 0b100))
+
+        db.session.delete(self.questions[0])
+        db.session.commit()
+
+        self.assertEqual(self.bits(), (0b10, 0b10))
+
+    def test_hidden_exam(self):
+        self.answer(self.questions[0])
+        self.answer(self.questions[1])
+        self.exam1.hidden = True
+        db.session.commit()
+
+        self.assertEqual(self.bits(), (0b01, 0b01))
+        self.assertEqual(generate_stats(self.course.code)['total'], 1)
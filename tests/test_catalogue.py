@@ -0,0 +1,117 @@
+from flask import url_for
+
+from memorizer import catalogue, models
+from memorizer.database import db
+from tests import DatabaseTestCase
+from tests.models_mock import add_course, add_exam, add_question_boolean, add_question_multiple
+
+
+class CatalogueTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.mock_user(save=True)
+        self.course = add_course()
+        self.exam = add_exam(self.course)
+        add_question_boolean(self.exam, text="Question")
+
+    def test_lookups(self):
+        self.assertEqual(catalogue.find_course(self.course.code), self.course)
+        self.assertEqual(catalogue.find_exam(self.course.code, self.exam.name), self.exam)
+        self.assertIsNone(catalogue.find_course('MISSING'))
+        self.assertIsNone(catalogue.find_exam(self.course.code, 'MISSING'))
+
+    def test_loaded_once(self):
+        url = url_for('quiz.question_exam', course_code=self.course.code, exam_name=self.exam.name, id=1)
+        self.client.get(url)
+        db.session.refresh(self.user)
+        with self.count_queries() as queries:
+            self.assert200(self.client.get(url))
+        lookups = [statement for statement in queries.statements if '\nFROM course' in statement]
+        self.assertLessEqual(len(lookups), 1)
+        lookups = [statement for statement in queries.statements if '\nFROM exam' in statement]
+        self.assertLessEqual(len(lookups), 1)
+
+    def test_content_changed(self):
+        self.assertIsNotNone(catalogue.find_exam(self.course.code, self.exam.name))
+        self.exam.name = 'V17'
+        db.session.commit()
+
+        self.assertIsNone(catalogue.find_exam(self.course.code, 'T16'))
+        self.assertEqual(catalogue.find_exam(self.course.code, 'V17'), self.exam)
+        self.assert404(self.client.get(url_for('quiz.exam', course='TEST', exam='T16')))
+        course = add_course(code='NEW')
+        self.assertEqual(catalogue.find_course('NEW'), course)
+
+    def test_hidden_exam(self):
+        self.exam.hidden = True
+        db.session.commit()
+        self.assert404(self.client.get(url_for(
+            'quiz.question_exam', course_code=self.course.code, exam_name=self.exam.name, id=1
+        )))
+        self.assertEqual(catalogue.course_exam_ids(self.course.code), [self.exam.id])
+        self.assertEqual(models.Question.query.count(), 1)
+
+    def test_question_counts(self):
+        hidden = add_exam(self.course, name='H17')
+        hidden.hidden = True
+        add_question_boolean(hidden, text="Hidden question")
+        empty = add_course(code='EMPTY')
+        self.assertEqual(catalogue.question_count(self.course.code), 1)
+        self.assertEqual(catalogue.question_count(empty.code), 0)
+
+        add_question_boolean(self.exam, text="Another question")
+        self.assertEqual(catalogue.question_count(self.course.code), 2)
+        hidden.hidden = False
+        db.session.commit()
+        self.assertEqual(catalogue.question_count(self.course.code), 3)
+
+    def count_queries_run(self):
+        with self.count_queries() as queries:
+            count = catalogue.question_count(self.course.code)
+        return count, len([statement for statement in queries.statements if 'count(question.id)' in statement])
+
+    def test_question_counts_kept(self):
+        self.assertEqual(self.count_queries_run(), (1, 1))
+        question = add_question_multiple(self.exam, text="Question", alternatives=[('Alternative', True)])
+        self.assertEqual(self.count_queries_run(), (2, 1))
+
+        question.alternatives[0].text = "Changed"
+        question.text = "Changed"
+        self.course.name = "Renamed"
+        self.course.code = "RENAMED"
+        db.session.commit()
+        self.assertEqual(self.count_queries_run(), (2, 0))
+
+        other = add_exam(self.course, name='H17')
+        self.assertEqual(self.count_queries_run(), (2, 0))
+        question.exam_id = other.id
+        db.session.commit()
+        self.assertEqual(self.count_queries_run(), (2, 1))
+        other.hidden = True
+        db.session.commit()
+        self.assertEqual(self.count_queries_run(), (1, 1))
+        db.session.delete(question)
+        db.session.commit()
+        self.assertEqual(self.count_queries_run(), (1, 1))
+
+        # An exam moved to another course, like through the exam API
+        other_course = add_course(code='OTHER')
+        self.assertEqual(self.count_queries_run(), (1, 0))
+        self.exam.course_id = other_course.id
+        db.session.commit()
+        self.assertEqual(self.count_queries_run(), (0, 1))
+        self.assertEqual(catalogue.question_count(other_course.code), 1)
+
+    def test_front_page_queries(self):
+        url = url_for('quiz.main')
+        self.client.get(url)
+        with self.count_queries() as queries:
+            self.assert200(self.client.get(url))
+        for n in range(5):
+            add_question_boolean(add_exam(add_course(code='C%d' % n)), text="Question")
+        self.client.get(url)
+        db.session.refresh(self.user)
+        with self.count_queries() as more_queries:
+            response = self.client.get(url)
+        self.assertIn(b'C4', response.data)
+        self.assertEqual(len(more_queries), len(queries))
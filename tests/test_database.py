@@ -0,0 +1,89 @@
+import os
+import tempfile
+import threading
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
+
+from memorizer import config, models
+from memorizer.database import db
+from tests import MemorizerTestCase
+from tests.models_mock import add_course, add_exam, add_question_boolean
+
+
+class SQLiteProfileTest(MemorizerTestCase):
+    """A SQLite database file set up like in production"""
+    def create_app(self):
+        app = super().create_app()
+        self.directory = tempfile.TemporaryDirectory()
+        app.config.update(
+            SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(self.directory.name, 'memorizer.db'),
+            # Fail fast instead of waiting for locks
+            SQLITE_PRAGMAS=dict(config.SQLITE_PRAGMAS, busy_timeout=100),
+            SQLITE_POOL_SIZE=config.SQLITE_POOL_SIZE,
+        )
+        return app
+
+    def setUp(self):
+        super().setUp()
+        db.create_all()
+        self.user = models.User()
+        db.session.add(self.user)
+        self.question = add_question_boolean(add_exam(add_course()), "Question")
+        self.user_id = self.user.id
+        self.question_id = self.question.id
+
+    def tearDown(self):
+        super().tearDown()
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        self.directory.cleanup()
+
+    def read_while_writing(self):
+        """Counts stats in another thread while an answer is being written, returns the count or the error"""
+        result = []
+        engine = db.engine
+
+        def read():
+            try:
+                with engine.connect() as connection:
+                    result.append(connection.execute('SELECT count(*) FROM stats').scalar())
+            except OperationalError as e:
+                result.append(e)
+        with engine.connect() as writer:
+            transaction = writer.begin()
+            # Holds the lock a commit takes, which keeps readers out of a rollback journal
+            writer.execute('BEGIN EXCLUSIVE')
+            writer.execute(models.Stats.__table__.insert(), {
+                'user_id': self.user_id, 'question_id': self.question_id, 'correct': True, 'reset': False
+            })
+            reader = threading.Thread(target=read)
+            reader.start()
+            reader.join(5)
+            transaction.rollback()
+        return result[0]
+
+    def test_pragmas(self):
+        with db.engine.connect() as connection:
+            self.assertEqual(connection.execute('PRAGMA journal_mode').scalar(), 'wal')
+            # NORMAL
+            self.assertEqual(connection.execute('PRAGMA synchronous').scalar(), 1)
+            self.assertEqual(connection.execute('PRAGMA busy_timeout').scalar(), 100)
+            self.assertEqual(connection.execute('PRAGMA cache_size').scalar(), config.SQLITE_PRAGMAS['cache_size'])
+        self.assertIsInstance(db.engine.pool, QueuePool)
+
+    def test_readers_do_not_wait_for_writers(self):
+        # The reader sees the database as it was before the answer
+        self.assertEqual(self.read_while_writing(), 0)
+
+    def test_rollback_journal_blocks_readers(self):
+        self.app.config.update(
+            SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(self.directory.name, 'rollback.db'),
+            SQLITE_PRAGMAS=dict(self.app.config['SQLITE_PRAGMAS'], journal_mode='DELETE'),
+        )
+        db.create_all()
+
+        error = self.read_while_writing()
+        self.assertIsInstance(error, OperationalError)
+        self.assertIn('database is locked', str(error))
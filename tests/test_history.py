@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from sqlalchemy_continuum import Operation, version_class
+
+from memorizer import history, models
+from memorizer.database import db, versioning_manager
+from tests import DatabaseTestCase
+from tests.models_mock import add_course, add_exam, add_question_boolean
+
+
+class CompactTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.exam = add_exam(add_course())
+        self.question = add_question_boolean(self.exam, text="Question 0")
+        for n in range(1, 5):
+            self.question.text = "Question %d" % n
+            db.session.commit()
+        self.question_id = self.question.id
+
+    def age(self, transactions, days=365):
+        """Moves the first transactions back in time"""
+        transaction_cls = versioning_manager.transaction_cls
+        ids = [transaction.id for transaction in transaction_cls.query.order_by(transaction_cls.id).limit(transactions)]
+        transaction_cls.query.filter(transaction_cls.id.in_(ids)).update(
+            {'issued_at': datetime.utcnow() - timedelta(days=days)}, synchronize_session=False
+        )
+        db.session.commit()
+
+    def versions(self, model, object_id):
+        version_cls = version_class(model)
+        return version_cls.query.filter_by(id=object_id).order_by(version_cls.transaction_id).all()
+
+    def test_squash(self):
+        # Course, exam, the question and three of its four edits
+        self.age(6)
+        removed, freed = history.compact_history(days=30, batch_size=2)
+
+        versions = self.versions(models.Question, self.question_id)
+        self.assertEqual([version.text for version in versions], ["Question 3", "Question 4"])
+        self.assertEqual(versions[0].operation_type, Operation.INSERT)
+        self.assertEqual(removed['question_version'], 3)
+        self.assertEqual(removed['transaction'], 3)
+        self.assertEqual(removed['course_version'], 0)
+        self.assertIsNotNone(freed)
+
+        page = history.history_page(models.Question, self.question_id)
+        self.assertEqual(page['total'], 2)
+        self.assertIn(['text', None, "Question 3"], page['versions'][-1]['changes'])
+
+    def test_recent_kept(self):
+        self.age(5, days=10)
+        removed, freed = history.compact_history(days=30)
+        self.assertEqual(sum(removed.values()), 0)
+        self.assertEqual(len(self.versions(models.Question, self.question_id)), 5)
+
+    def test_deleted(self):
+        db.session.delete(self.question)
+        db.session.commit()
+        self.age(8)
+        removed, freed = history.compact_history(days=30)
+
+        self.assertEqual(self.versions(models.Question, self.question_id), [])
+        self.assertEqual(len(self.versions(models.Exam, self.exam.id)), 1)
+        # The transactions creating the course and exam are still used
+        self.assertEqual(versioning_manager.transaction_cls.query.count(), 2)
+
+    def test_transactions_in_batches(self):
+        self.age(6)
+        history.compact_versions(models.Question, datetime.utcnow() - timedelta(days=30), batch_size=100)
+        with self.count_queries() as queries:
+            removed = history.compact_transactions(datetime.utcnow() - timedelta(days=30), batch_size=1)
+        self.assertEqual(removed, 3)
+        # Nothing is read without a limit
+        reads = [statement for statement in queries.statements if statement.startswith('SELECT')]
+        self.assertEqual(len(reads), 7)
+        self.assertTrue(all('LIMIT' in statement for statement in reads))
+
+    def test_command(self):
+        self.age(6)
+        with patch('builtins.print') as output:
+            history.CompactCommand().run(days=30, batch_size=100)
+        self.assertIn('Removed 6 rows', output.call_args[0][0])
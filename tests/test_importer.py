@@ -1,7 +1,18 @@
+import gc
+import io
+import json
+import os
+import tempfile
+import warnings
 from unittest import TestCase
 from unittest.mock import call, patch
 
-from memorizer import importer, models
+from flask_sqlalchemy import BaseQuery
+from sqlalchemy_continuum import version_class
+
+from memorizer import importer, jsonstream, models
+from memorizer.database import db, versioning_manager, versioning_policy
+from memorizer.utils import max_questions_course, max_questions_exam
 from tests import DatabaseTestCase
 
 
@@ -164,43 +175,47 @@ class ImportCommandTest(TestCase):
         json_load_patch.assert_has_calls([call(f) for f in filenames], any_order=True)
 
 
+def exam_json():
+    return {
+        "name": "Innføring i medisin for ikke-medisinere",
+        "code": "MFEL1010",
+        "exam": "H10",
+        "questions": [
+            {
+                "question": "Question 1",
+                "answers": [
+                    "Alternative 1.1",
+                    "Alternative 1.2",
+                    "Alternative 1.3",
+                    "Alternative 1.4"
+                ],
+                "correct": 0
+            },
+            {
+                "question": "Question 2",
+                "answer": True
+            },
+            {
+                "question": "Question 3",
+                "answers": [
+                    "Alternative 3.1",
+                    "Alternative 3.2",
+                    "Alternative 3.3",
+                    "Alternative 3.4"
+                ],
+                "correct": [1, 2]
+            },
+            {
+                "question": "Question 4",
+                "answer": False
+            }
+        ]
+    }
+
+
 class JsonImportTest(DatabaseTestCase):
     def test_import_exam(self):
-        exam = {
-            "name": "Innføring i medisin for ikke-medisinere",
-            "code": "MFEL1010",
-            "exam": "H10",
-            "questions": [
-                {
-                    "question": "Question 1",
-                    "answers": [
-                        "Alternative 1.1",
-                        "Alternative 1.2",
-                        "Alternative 1.3",
-                        "Alternative 1.4"
-                    ],
-                    "correct": 0
-                },
-                {
-                    "question": "Question 2",
-                    "answer": True
-                },
-                {
-                    "question": "Question 3",
-                    "answers": [
-                        "Alternative 3.1",
-                        "Alternative 3.2",
-                        "Alternative 3.3",
-                        "Alternative 3.4"
-                    ],
-                    "correct": [1, 2]
-                },
-                {
-                    "question": "Question 4",
-                    "answer": False
-                }
-            ]
-        }
+        exam = exam_json()
         importer.import_exam(exam)
         assert models.Question.query.count() == len(exam['questions'])
         exam_obj = models.Exam.query.first()
@@ -211,6 +226,44 @@ class JsonImportTest(DatabaseTestCase):
         for question in exam['questions']:
             self.validate_question(question)
 
+    def test_versions(self):
+        self.assertEqual(importer.import_exam(exam_json()), 12)
+        questions = models.Question.query.all()
+        transactions = {version.transaction_id for question in questions for version in question.versions}
+        transactions |= {
+            version.transaction_id
+            for question in questions
+            for alternative in question.alternatives
+            for version in alternative.versions
+        }
+        self.assertEqual(len(transactions), 1)
+        self.assertEqual(questions[0].versions[0].text, 'Question 1')
+
+    def test_cache_invalidated(self):
+        exam = exam_json()
+        self.assertEqual(max_questions_course(exam['code']), 0)
+        importer.import_exam(exam)
+        self.assertEqual(max_questions_course(exam['code']), 4)
+        self.assertEqual(max_questions_exam(exam['code'], exam['exam']), 4)
+
+    def test_exam_created_concurrently(self):
+        exam = exam_json()
+        course = models.Course(exam['code'], exam['name'])
+        db.session.add(course)
+        db.session.commit()
+        existing = models.Exam(exam['exam'], course.id)
+        db.session.add(existing)
+        db.session.commit()
+        first = BaseQuery.first
+        # The course is found, but the exam is created by another import after it is looked up
+        found = iter([True, False])
+
+        def racing_first(query):
+            return first(query) if next(found, True) else None
+        with patch.object(BaseQuery, 'first', racing_first):
+            self.assertEqual(importer.get_exam(exam).id, existing.id)
+        self.assertEqual(models.Exam.query.count(), 1)
+
     def validate_question(self, question):
         obj = models.Question.query.filter_by(text=question['question']).first()
         self.assertIsNotNone(obj)
@@ -229,3 +282,184 @@ class JsonImportTest(DatabaseTestCase):
         else:
             correct = index == correct_answer
         self.assertEqual(correct, alternative.correct)
+
+
+class VersioningPolicyTest(DatabaseTestCase):
+    def set_policy(self, mode, unversioned=()):
+        self.app.config.update(VERSIONING=mode, UNVERSIONED_MODELS=list(unversioned))
+        versioning_policy.init_app(self.app)
+
+    def count_versions(self, model):
+        return version_class(model).query.count()
+
+    def test_sync(self):
+        self.set_policy('sync')
+        exam = importer.get_exam(exam_json())
+        importer.import_questions(exam_json()['questions'][:2], exam)
+        self.assertEqual(self.count_versions(models.Question), 2)
+        importer.import_questions(exam_json()['questions'][2:], exam)
+        db.session.commit()
+
+        self.assertEqual(self.count_versions(models.Question), 4)
+        self.assertEqual(self.count_versions(models.Alternative), 8)
+        # Shared with the course and exam
+        self.assertEqual(versioning_manager.transaction_cls.query.count(), 1)
+
+    def test_off(self):
+        self.set_policy('off')
+        importer.import_exam(exam_json())
+        question = models.Question.query.first()
+        question.text = 'Changed'
+        db.session.commit()
+
+        self.assertEqual(models.Alternative.query.count(), 8)
+        self.assertEqual(self.count_versions(models.Question), 0)
+        self.assertEqual(versioning_manager.transaction_cls.query.count(), 0)
+
+    def test_unversioned_model(self):
+        self.set_policy('sync', ['Alternative'])
+        importer.import_exam(exam_json())
+        alternative = models.Alternative.query.first()
+        alternative.text = 'Changed'
+        db.session.commit()
+
+        self.assertEqual(self.count_versions(models.Question), 4)
+        self.assertEqual(self.count_versions(models.Alternative), 0)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            self.set_policy('later')
+
+
+class StreamImportTest(DatabaseTestCase):
+    def test_stream(self):
+        exam = exam_json()
+        fields = jsonstream.iter_fields(io.StringIO(json.dumps(exam)), 'questions', chunk_size=16)
+        self.assertEqual(importer.import_exam_stream(fields, batch_size=3), 12)
+        self.assertEqual(models.Question.query.count(), 4)
+        self.assertEqual(models.Alternative.query.count(), 8)
+        self.assertEqual(models.Exam.query.one().course.code, exam['code'])
+
+    def test_stream_header_last(self):
+        exam = exam_json()
+        questions = exam.pop('questions')
+        text = json.dumps({'questions': questions, **exam})
+        importer.import_exam_stream(jsonstream.iter_fields(io.StringIO(text), 'questions'), batch_size=1)
+        self.assertEqual([q.text for q in models.Question.query], [q['question'] for q in questions])
+
+    def test_json_lines(self):
+        exam = exam_json()
+        questions = exam.pop('questions')
+        lines = '\n'.join(json.dumps(line) for line in [exam] + questions)
+        importer.import_exam_stream(jsonstream.iter_lines(io.StringIO(lines), 'questions'))
+        self.assertEqual(models.Question.query.count(), 4)
+
+    def test_invalid_question_rolls_back(self):
+        exam = exam_json()
+        exam['questions'].append({'question': 'Invalid'})
+        fields = jsonstream.iter_fields(io.StringIO(json.dumps(exam)), 'questions')
+        with self.assertRaises(importer.ValidationError):
+            importer.import_exam_stream(fields, batch_size=2)
+        self.assertEqual(models.Question.query.count(), 0)
+        self.assertEqual(models.Course.query.count(), 0)
+
+    def test_missing_header(self):
+        exam = exam_json()
+        del exam['code']
+        with self.assertRaises(importer.ValidationError):
+            importer.import_exam_stream(jsonstream.iter_fields(io.StringIO(json.dumps(exam)), 'questions'))
+
+    def test_invalid_json(self):
+        with self.assertRaises(json.JSONDecodeError):
+            importer.import_exam_stream(jsonstream.iter_fields(io.StringIO('{"code": "A",'), 'questions'))
+
+    def test_trailing_content(self):
+        text = json.dumps(exam_json()) + ' junk'
+        with self.assertRaises(json.JSONDecodeError):
+            importer.import_exam_stream(jsonstream.iter_fields(io.StringIO(text), 'questions', chunk_size=16))
+        self.assertEqual(models.Question.query.count(), 0)
+        with self.assertRaises(json.JSONDecodeError):
+            list(jsonstream.iter_fields(io.StringIO('{} {}'), 'questions'))
+        self.assertEqual(list(jsonstream.iter_fields(io.StringIO('{}\n'), 'questions')), [])
+
+    @patch('builtins.print')
+    def test_command(self, print_patch):
+        exam = exam_json()
+        with tempfile.NamedTemporaryFile('w+', suffix='.json') as file:
+            json.dump(exam, file)
+            file.seek(0)
+            importer.ImportCommand().run([file], stream=True, batch_size=2)
+        self.assertEqual(models.Question.query.count(), 4)
+
+
+class ParallelImportTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+        super().tearDown()
+
+    def write(self, name, exam, lines=False):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as file:
+            if lines:
+                questions = exam.pop('questions')
+                file.write('\n'.join(json.dumps(line) for line in [exam] + questions))
+            else:
+                json.dump(exam, file)
+        return path
+
+    @patch('builtins.print')
+    def test_import(self, print_patch):
+        exams = [exam_json() for _ in range(3)]
+        for i, exam in enumerate(exams):
+            exam['exam'] = 'E{}'.format(i)
+        paths = [
+            self.write('a.json', exams[0]),
+            self.write('b.jsonl', exams[1], lines=True),
+            self.write('c.json', exams[2]),
+        ]
+        self.assertEqual(importer.import_files_parallel(paths, processes=2, batch_size=3), [])
+        self.assertEqual(models.Course.query.count(), 1)
+        self.assertEqual(models.Exam.query.count(), 3)
+        self.assertEqual(models.Question.query.count(), 12)
+        self.assertEqual(max_questions_course(exams[0]['code']), 12)
+
+    @patch('builtins.print')
+    def test_invalid_file(self, print_patch):
+        invalid = exam_json()
+        invalid['exam'] = 'Invalid'
+        invalid['questions'].append({'question': 'Invalid'})
+        paths = [self.write('valid.json', exam_json()), self.write('invalid.json', invalid)]
+        self.assertEqual(importer.import_files_parallel(paths, processes=2), [paths[1]])
+        self.assertEqual(models.Exam.query.one().name, exam_json()['exam'])
+        self.assertEqual(models.Question.query.count(), 4)
+
+    def test_validate_file(self):
+        exam = exam_json()
+        exam['questions'] = []
+        with self.assertRaises(importer.ValidationError):
+            importer.validate_file(self.write('empty.json', exam))
+        header = importer.validate_file(self.write('exam.json', exam_json()))
+        self.assertEqual(header, {key: exam_json()[key] for key in importer.HEADER_KEYS})
+
+    def test_lines_header_not_object(self):
+        path = os.path.join(self.directory.name, 'exam.jsonl')
+        with open(path, 'w') as file:
+            file.write('["code", "name"]\n' + json.dumps(exam_json()['questions'][0]))
+        with self.assertRaises(importer.ValidationError):
+            importer.validate_file(path)
+        with patch('builtins.print'):
+            self.assertEqual(importer.import_files_parallel([path], processes=1), [path])
+
+    def test_files_closed(self):
+        path = self.write('exam.json', exam_json())
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always', ResourceWarning)
+            importer.validate_file(path)
+            with self.assertRaises(importer.ValidationError):
+                importer.validate_file(self.write('empty.json', dict(exam_json(), questions=[])))
+            gc.collect()
+        self.assertEqual([warning for warning in caught if warning.category is ResourceWarning], [])
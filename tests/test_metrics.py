@@ -0,0 +1,70 @@
+from unittest.mock import patch
+
+from flask import g, url_for
+from sqlalchemy.exc import OperationalError
+
+from memorizer.database import db
+from memorizer.metrics import sql_metrics
+from tests import DatabaseTestCase
+from tests.models_mock import add_course, add_exam, add_question_boolean
+
+
+class SQLMetricsTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        sql_metrics.reset()
+        self.user = self.mock_user(registered=True, save=True)
+        self.course = add_course()
+        self.exam = add_exam(self.course)
+        add_question_boolean(self.exam, text="Question")
+
+    def tearDown(self):
+        sql_metrics.reset()
+        super().tearDown()
+
+    def test_server_timing(self):
+        url = url_for('api.course_questions', course=self.course.code)
+        with self.count_queries() as queries:
+            response = self.client.get(url)
+        timing = response.headers['Server-Timing']
+        self.assertTrue(timing.startswith('db;dur='))
+        self.assertIn('desc="{} queries"'.format(len(queries)), timing)
+
+    def test_endpoint_totals(self):
+        url = url_for('api.course_questions', course=self.course.code)
+        self.client.get(url)
+        self.client.get(url, headers={'If-None-Match': 'other'})
+
+        metrics = dict(sql_metrics.summary())['api.course_questions']
+        self.assertEqual(metrics.requests, 2)
+        self.assertGreater(metrics.queries, 0)
+        self.assertLessEqual(len(metrics.slowest), sql_metrics.keep_slowest)
+
+    def test_slow_query_log(self):
+        with patch.object(sql_metrics, 'threshold', 0), patch.object(self.app.logger, 'warning') as warning:
+            self.client.get(url_for('api.course_questions', course=self.course.code))
+        self.assertTrue(warning.called)
+        self.assertEqual(warning.call_args[0][1], 'api.course_questions')
+
+    def test_failed_statement(self):
+        with self.app.test_request_context():
+            sql_metrics.before_request()
+            with self.assertRaises(OperationalError):
+                db.session.execute('SELECT * FROM missing')
+            db.session.rollback()
+            connection = db.session.connection()
+            connection.execute('SELECT 1')
+            self.assertEqual(g.sql_queries, 1)
+            self.assertNotIn('query_start', connection.info)
+
+    def test_metrics_page(self):
+        self.client.get(url_for('api.course_questions', course=self.course.code))
+        self.assertRedirects(self.client.get(url_for('admin.metrics')), url_for('admin.index'))
+
+        self.user.admin = True
+        response = self.client.get(url_for('admin.metrics'))
+        self.assert200(response)
+        self.assertIn(b'api.course_questions', response.data)
+        self.client.post(url_for('admin.metrics'))
+        # Only the reset request itself is left
+        self.assertEqual([endpoint for endpoint, metrics in sql_metrics.summary()], ['admin.metrics'])
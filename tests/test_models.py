@@ -1,7 +1,9 @@
 from memorizer.database import db
 from memorizer import models
+from memorizer.utils import max_questions_course
 
 from tests import DatabaseTestCase
+from tests.models_mock import add_course, add_exam, add_question_boolean
 
 
 class ModelTestCase:
@@ -110,3 +112,74 @@ class TestStatsModel(ModelTestCase, DatabaseTestCase):
 
     def edit(self, stats):
         stats.correct = True
+
+
+class TestQuestionOrdinals(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = add_course()
+        self.exam1 = add_exam(self.course, name="H16")
+        self.exam2 = add_exam(self.course, name="V17")
+        self.questions = [
+            add_question_boolean(self.exam1, text="Question 1"),
+            add_question_boolean(self.exam2, text="Question 2"),
+            add_question_boolean(self.exam1, text="Question 3"),
+        ]
+
+    def course_questions(self):
+        count = max_questions_course(self.course.code)
+        return [self.course.question(n).first() for n in range(1, count + 1)]
+
+    def test_course_order(self):
+        self.assertEqual(self.course_questions(), self.questions)
+        self.assertIsNone(self.course.question(0).first())
+        self.assertIsNone(self.course.question(4).first())
+
+    def test_exam_order(self):
+        self.assertEqual(self.exam1.question(1).first(), self.questions[0])
+        self.assertEqual(self.exam1.question(2).first(), self.questions[2])
+        self.assertIsNone(self.exam1.question(3).first())
+
+    def test_insert(self):
+        self.course_questions()
+        question = add_question_boolean(self.exam2, text="Question 4")
+        self.assertEqual(self.course_questions(), self.questions + [question])
+        self.assertEqual(self.exam2.question(2).first(), question)
+
+    def test_delete(self):
+        self.course_questions()
+        db.session.delete(self.questions[1])
+        db.session.commit()
+        self.assertEqual(self.course_questions(), [self.questions[0], self.questions[2]])
+
+    def test_move(self):
+        self.assertEqual(self.exam2.question(1).first(), self.questions[1])
+        self.questions[0].exam_id = self.exam2.id
+        db.session.commit()
+        self.assertEqual(self.exam2.question(1).first(), self.questions[0])
+        self.assertEqual(self.exam1.question(1).first(), self.questions[2])
+
+    def test_hide(self):
+        self.course_questions()
+        self.exam1.hidden = True
+        db.session.commit()
+        self.assertEqual(self.course_questions(), [self.questions[1]])
+
+    def test_index(self):
+        self.assertEqual([question.index for question in self.questions], [1, 1, 2])
+        self.questions[0].exam_id = self.exam2.id
+        db.session.commit()
+        self.assertEqual([question.index for question in self.questions], [1, 2, 1])
+
+    def test_index_query_count(self):
+        question = self.questions[2]
+        db.session.refresh(question)
+        with self.count_queries() as small_exam:
+            self.assertEqual(question.index, 2)
+        for n in range(50):
+            add_question_boolean(self.exam1, text="Question")
+        db.session.refresh(question)
+        with self.count_queries() as large_exam:
+            self.assertEqual(question.index, 2)
+        self.assertEqual(len(small_exam), 1)
+        self.assertEqual(len(large_exam), len(small_exam))
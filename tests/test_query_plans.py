@@ -0,0 +1,69 @@
+import re
+
+from memorizer import models, utils
+from memorizer.database import db
+from tests import DatabaseTestCase
+from tests.models_mock import add_course, add_exam, add_question_boolean, add_question_multiple
+
+# A table read without an index, e.g. "SCAN stats" or "SCAN TABLE stats AS stats_1".
+# Subqueries (anon_1) are scanned once built, the steps building them are checked as well
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?(?!anon_)\w+( AS \w+)?$')
+
+
+class QueryPlanTest(DatabaseTestCase):
+    """The queries run on every quiz request should only search indexes"""
+    def setUp(self):
+        super().setUp()
+        self.user = self.mock_user(save=True)
+        self.course = add_course()
+        self.exam = add_exam(self.course)
+        self.question = add_question_multiple(self.exam, "Question", [("Right", True), ("Wrong", False)])
+        add_question_boolean(self.exam, "Question")
+        db.session.add(models.Stats(self.user, self.question, True))
+        db.session.commit()
+
+    def plan(self, statement, parameters):
+        cursor = db.session.connection().connection.cursor()
+        return [row[-1] for row in cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)]
+
+    def assertIndexed(self, function, *args):
+        with self.count_queries() as queries:
+            function(*args)
+        self.assertTrue(queries.statements)
+        for statement, parameters in zip(queries.statements, queries.parameters):
+            for step in self.plan(statement, parameters):
+                self.assertNotRegex(step, FULL_SCAN, statement)
+
+    def test_stats_course(self):
+        self.assertIndexed(lambda: models.Stats.course(self.user, self.course.code).all())
+
+    def test_stats_exam(self):
+        self.assertIndexed(lambda: models.Stats.exam(self.user, self.course.code, self.exam.name).all())
+
+    def test_answered(self):
+        self.assertIndexed(models.Stats.answered, self.user, self.question)
+
+    def test_all_questions_course(self):
+        self.assertIndexed(utils.all_questions, self.course.code, None)
+
+    def test_all_questions_exam(self):
+        self.assertIndexed(utils.all_questions, self.course.code, self.exam.name)
+
+    def test_find_index(self):
+        self.assertIndexed(models.Question.find_index, self.question)
+
+    def test_answer_key(self):
+        self.assertIndexed(utils.answer_key, self.question.id)
+
+    def test_add_once(self):
+        self.assertIndexed(models.Stats.add_once, self.user, self.question.id, True)
+
+    def test_random_question(self):
+        # With every question answered only the answered questions bitset is built
+        boolean = models.Question.query.filter_by(type=models.Question.BOOLEAN).one()
+        db.session.add(models.Stats(self.user, boolean, True))
+        db.session.commit()
+        self.assertIndexed(utils.random_id, 1, self.course.code, None)
+
+    def test_stats_summary(self):
+        self.assertIndexed(models.StatsSummary.find, self.user, self.course.code, self.exam.name)
@@ -4,6 +4,7 @@ import random
 
 from memorizer.database import db
 from memorizer.models import Course, Exam, Question, Stats, User
+from memorizer.stats import CheckCommand
 from memorizer.utils import generate_stats
 from tests import DatabaseTestCase, MemorizerTestCase
 from tests.models_mock import add_course, add_exam, add_question_multiple
@@ -150,10 +151,11 @@ class ResetStatsTest(DatabaseTestCase):
                 exam = Exam("V%d" % exam_n, course.id)
                 db.session.add(exam)
                 db.session.commit()
-                question = Question(exam_id=exam.id, type=Question.BOOLEAN, text="Test Question", correct=True)
-                db.session.add(question)
-                db.session.commit()
+                # A question has one current answer
                 for stats_n in range(2):
+                    question = Question(exam_id=exam.id, type=Question.BOOLEAN, text="Test Question", correct=True)
+                    db.session.add(question)
+                    db.session.commit()
                     stats = Stats(self.user, question, random.choice([True, False]))
                     db.session.add(stats)
         db.session.commit()
@@ -281,3 +283,87 @@ class QuestionTest(DatabaseTestCase):
     def post_answer(self, url, answer='true'):
         response = self.client.post(url, data={'answer': answer})
         return response
+
+
+class AnonymousUserTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = add_course()
+        self.exam = add_exam(self.course)
+        self.question = Question(exam_id=self.exam.id, type=Question.BOOLEAN, text="Test Question", correct=True)
+        db.session.add(self.question)
+        db.session.commit()
+
+    def answer(self):
+        return self.client.post(url_for('api.answer'), data={'question': self.question.id, 'correct': 'true'})
+
+    def test_browsing_without_writes(self):
+        urls = [
+            url_for('quiz.main'),
+            url_for('quiz.question_course', course_code=self.course.code, id=1),
+            url_for('quiz.question_exam', course_code=self.course.code, exam_name=self.exam.name, id=1),
+            url_for('api.course_questions', course=self.course.code),
+            url_for('api.stats_course', course_code=self.course.code),
+            url_for('api.random_question_course', course_code=self.course.code),
+        ]
+        with self.count_queries() as queries:
+            for url in urls:
+                self.assert200(self.client.get(url))
+        writes = [statement for statement in queries.statements if not statement.startswith('SELECT')]
+        self.assertEqual(writes, [])
+        self.assertEqual(User.query.count(), 0)
+
+    def test_answer_saves_user(self):
+        response = self.answer()
+
+        self.assertTrue(response.json['success'])
+        user = User.query.one()
+        self.assertFalse(user.registered)
+        self.assertEqual(Stats.query.one().user_id, user.id)
+        with self.client.session_transaction() as sess:
+            self.assertEqual(sess['user'], user.id)
+
+    def test_register_keeps_answers(self):
+        self.answer()
+        self.client.post('/register/', data={'name': 'Name', 'username': 'name', 'password': 'pw', 'confirm': 'pw'})
+
+        user = User.query.one()
+        self.assertTrue(user.registered)
+        self.assertEqual(Stats.query.one().user_id, user.id)
+
+    def test_login_moves_answers(self):
+        account = User()
+        account.username = 'account'
+        account.password = 'password'
+        account.registered = True
+        db.session.add(account)
+        db.session.commit()
+        self.answer()
+
+        response = self.client.post('/login/', data={'username': 'account', 'password': 'password'})
+
+        self.assert_redirects(response, url_for('quiz.main'))
+        self.assertEqual(Stats.query.one().user_id, account.id)
+        self.set_user(account)
+        self.assertEqual(generate_stats(self.course.code)['total'], 1)
+
+    def test_login_keeps_account_answers(self):
+        account = User()
+        account.username = 'account'
+        account.password = 'password'
+        account.registered = True
+        db.session.add(account)
+        db.session.commit()
+        db.session.add(Stats(account, self.question, False))
+        db.session.commit()
+        self.answer()
+
+        self.client.post('/login/', data={'username': 'account', 'password': 'password'})
+
+        self.assertEqual(Stats.query.filter_by(user_id=account.id, reset=False).one().correct, False)
+        self.assertEqual(Stats.query.filter_by(user_id=account.id).count(), 2)
+        self.set_user(account)
+        stats = generate_stats(self.course.code)
+        self.assertEqual((stats['total'], stats['points'], stats['combo']), (1, 0, 0))
+        with patch('builtins.print'):
+            self.assertEqual(CheckCommand().run(), 0)
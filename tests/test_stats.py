@@ -0,0 +1,134 @@
+from unittest.mock import patch
+
+from flask import url_for
+from sqlalchemy.exc import IntegrityError
+
+from memorizer import models, stats
+from memorizer.database import db
+from memorizer.utils import generate_stats
+from tests import DatabaseTestCase
+from tests.models_mock import add_course, add_exam, add_question_boolean
+
+
+class StatsSummaryTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.mock_user(save=True)
+        self.course = add_course()
+        self.exam1 = add_exam(self.course, name="H16")
+        self.exam2 = add_exam(self.course, name="V17")
+        self.questions = [add_question_boolean(exam, text="Question") for exam in (self.exam1, self.exam2) * 3]
+
+    def answer(self, question, correct):
+        answer = 'true' if correct else 'false'
+        self.client.post(url_for('api.answer'), data={'question': question.id, 'correct': answer})
+
+    def assertConsistent(self):
+        with patch('builtins.print'):
+            self.assertEqual(stats.CheckCommand().run(), 0)
+
+    def test_answers(self):
+        for question, correct in zip(self.questions, [True, False, True, True, False, True]):
+            self.answer(question, correct)
+
+        course_stats = generate_stats(self.course.code)
+        self.assertEqual((course_stats['total'], course_stats['points'], course_stats['combo']), (6, 4, 1))
+        exam_stats = generate_stats(self.course.code, self.exam1.name)
+        self.assertEqual((exam_stats['total'], exam_stats['points'], exam_stats['combo']), (3, 2, 0))
+        self.assertConsistent()
+
+    def test_answered_twice(self):
+        self.answer(self.questions[0], True)
+        self.answer(self.questions[0], False)
+
+        self.assertEqual(generate_stats(self.course.code)['combo'], 1)
+        self.assertConsistent()
+
+    def test_reset_exam(self):
+        for question, correct in zip(self.questions, [True, False, True, True, True, True]):
+            self.answer(question, correct)
+
+        self.client.get(url_for('quiz.reset_stats_exam', course=self.course.code, exam=self.exam2.name))
+
+        self.assertEqual(generate_stats(self.course.code, self.exam2.name)['total'], 0)
+        course_stats = generate_stats(self.course.code)
+        self.assertEqual((course_stats['total'], course_stats['points'], course_stats['combo']), (3, 3, 3))
+        self.assertConsistent()
+
+    def test_reset_course(self):
+        for question in self.questions:
+            self.answer(question, True)
+
+        self.client.get(url_for('quiz.reset_stats_course', course=self.course.code))
+
+        self.assertEqual(generate_stats(self.course.code)['total'], 0)
+        self.assertEqual(generate_stats(self.course.code, self.exam1.name)['total'], 0)
+        self.assertConsistent()
+
+    def test_wrong_first_answer(self):
+        self.answer(self.questions[0], False)
+
+        self.assertEqual(models.StatsSummary.query.count(), 0)
+        course_stats = generate_stats(self.course.code)
+        self.assertEqual((course_stats['total'], course_stats['points'], course_stats['combo']), (1, 0, 0))
+        self.assertConsistent()
+
+    def test_hidden_exam(self):
+        self.answer(self.questions[0], True)
+        self.answer(self.questions[1], True)
+        self.exam1.hidden = True
+        db.session.commit()
+
+        course_stats = generate_stats(self.course.code)
+        self.assertEqual((course_stats['max'], course_stats['total'], course_stats['points']), (3, 1, 1))
+
+    def test_course_totals_unique(self):
+        self.answer(self.questions[0], True)
+        db.session.add(models.StatsSummary(self.user.id, self.course.id))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+    def test_current_answer_unique(self):
+        self.answer(self.questions[0], True)
+        db.session.add(models.Stats(self.user, self.questions[0], False))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+        reset = models.Stats(self.user, self.questions[0], False)
+        reset.reset = True
+        db.session.add(reset)
+        db.session.commit()
+
+    def test_concurrent_first_answer(self):
+        self.answer(self.questions[0], True)
+        add_answer = models.StatsSummary._add_answer
+        calls = []
+
+        def missed_once(*args):
+            # The first update runs before another first answer is committed
+            calls.append(args)
+            return 0 if len(calls) == 1 else add_answer(*args)
+        db.session.add(models.Stats(self.user, self.questions[2], True))
+        with patch.object(models.StatsSummary, '_add_answer', side_effect=missed_once):
+            models.StatsSummary.record(self.user, self.course.id, self.exam1.id, True)
+        db.session.commit()
+
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(models.StatsSummary.query.filter_by(exam_id=models.StatsSummary.COURSE).count(), 1)
+        course_stats = generate_stats(self.course.code)
+        self.assertEqual((course_stats['total'], course_stats['combo']), (2, 2))
+        self.assertConsistent()
+
+    def test_backfill(self):
+        for question, correct in zip(self.questions, [True, False, True]):
+            db.session.add(models.Stats(self.user, question, correct))
+        db.session.commit()
+        with patch('builtins.print'):
+            self.assertEqual(stats.CheckCommand().run(), 1)
+            stats.BackfillCommand().run()
+
+        course_stats = generate_stats(self.course.code)
+        self.assertEqual((course_stats['total'], course_stats['points'], course_stats['combo']), (3, 2, 1))
+        self.assertConsistent()